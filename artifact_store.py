@@ -0,0 +1,78 @@
+import os
+import shutil
+from pathlib import Path
+
+from shared import TARGET_PATH, hash_file
+
+# Content-addressed store for the build artifacts. Every distinct binary/.pdb is stored once as
+# `target/blobs/<sha256>` and the paths in target/<version>/... are hardlinks to it. Identical
+# outputs of different matrix cells (e.g. hello_world across adjacent toolchains) thus only take up
+# space once and the evaluation scripts can use the hashes in the registry (see registry.py) to
+# only evaluate each distinct binary once.
+#
+# NOTE: Blobs are read-only since modifying any of the links would modify all of them. They keep
+#       the executable bits of the artifact they were added from; fetched malware samples are never
+#       executable (see malware_fetcher.py).
+
+BLOBS_PATH = TARGET_PATH / "blobs"
+
+
+# Falls back to copying if hardlinking isn't possible (e.g. different file systems)
+def link_or_copy(src, dst):
+    tmp_dst = dst.with_name(f".{dst.name}.tmp")
+    tmp_dst.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp_dst)
+    except OSError:
+        shutil.copy2(src, tmp_dst)
+    tmp_dst.replace(dst)
+
+
+# Adds a file to the store and returns its hash
+def add_blob(path):
+    digest = hash_file(path)
+    blob = BLOBS_PATH / digest
+    if not blob.exists():
+        BLOBS_PATH.mkdir(parents=True, exist_ok=True)
+        link_or_copy(path, blob)
+        blob.chmod(blob.stat().st_mode & 0o555)
+    return digest
+
+
+def link_blob(digest, dst):
+    blob = BLOBS_PATH / digest
+    if dst.exists() and dst.samefile(blob):
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    link_or_copy(blob, dst)
+
+
+# Groups binaries with identical content (and identical `extra` key, e.g. the flags for crate
+# signature generation). Map: unstripped bin to evaluate -> unstripped bins sharing its results
+def dedupe(binaries, hashes, extra=lambda unstripped: None):
+    groups = {}
+    for unstripped, stripped in binaries.items():
+        # Without hashes (e.g. missing artifacts) every binary is distinct
+        key = (hashes.get(unstripped, unstripped), hashes.get(stripped, stripped), extra(unstripped))
+        groups.setdefault(key, []).append(unstripped)
+    return {aliases[0]: aliases[1:] for aliases in groups.values()}
+
+
+# Makes the results of `unstripped` available under all its aliases
+def fan_out(out_path, alias_out_paths, suffixes):
+    for suffix in suffixes:
+        src = out_path.with_suffix(out_path.suffix + suffix)
+        if not src.exists():
+            continue
+        for alias_out_path in alias_out_paths:
+            dst = alias_out_path.with_suffix(alias_out_path.suffix + suffix)
+            if dst.exists() and dst.samefile(src):
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(src, dst)
+
+
+def hash_artifacts(paths, known_hashes):
+    return {
+        str(p): known_hashes.get(Path(p)) or hash_file(p) for p in paths if Path(p).exists()
+    }
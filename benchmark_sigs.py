@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import metrics
+from evaluate_crates import SIGNATURES_PATH as CRATE_SIGNATURES_PATH
+from registry import select
+from shared import (
+    FLAIR_PATH,
+    TARGET_PATH,
+    flair_version,
+    rust_sig_gen_version,
+    sig_stamp,
+)
+
+# Benchmarks how long IDA takes to apply the generated signatures. Every binary gets auto-analyzed
+# once (see benchmark_worker.py); then every signature set is applied to fresh copies of that
+# analysis, once cold and `--warm` times warm. Results are written per RustSigGen version so two
+# versions can be compared with `--compare`.
+#
+# NOTE: `rust-sig-gen` needs to be available in $PATH and crate signatures are taken from a previous
+#       evaluate_crates.py run
+
+# Bump whenever the structure of the results changes
+BENCHMARK_VERSION = 1
+
+BENCHMARKS_PATH = TARGET_PATH / "benchmarks"
+STD_SIGNATURES_PATH = BENCHMARKS_PATH / "std_sigs"
+
+WORKER_PATH = Path(__file__).parent / "benchmark_worker.py"
+
+SIG_SETS = ["std", "crates", "std+crates"]
+
+
+# Same signatures the evaluation generates for the binary but kept around between runs
+def std_sigs(source, rel_path):
+    out_dir = (STD_SIGNATURES_PATH / rel_path).absolute()
+    key_path = out_dir.parent / f"{out_dir.name}.key"
+    key = sig_stamp(source)
+    if not (key_path.exists() and key_path.read_text() == key and out_dir.exists()):
+        shutil.rmtree(out_dir, ignore_errors=True)
+        out_dir.parent.mkdir(parents=True, exist_ok=True)
+        metrics.check_output(
+            ["rust-sig-gen", "-f", str(FLAIR_PATH), "-o", str(out_dir), "std", source],
+            "rust-sig-gen std",
+            source,
+        )
+        key_path.write_text(key)
+    return sorted(out_dir.glob("*.sig"))
+
+
+def sig_sets(source, rel_path):
+    std = std_sigs(source, rel_path)
+    crates = sorted((CRATE_SIGNATURES_PATH / rel_path).absolute().glob("*.sig"))
+    sets = {"std": std}
+    if crates:
+        sets |= {"crates": crates, "std+crates": std + crates}
+    return {name: sigs for name, sigs in sets.items() if name in args.sets}
+
+
+def run_worker(binary, mode, *worker_args):
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as tmp_dir:
+        out_path = Path(tmp_dir) / "out.json"
+        metrics.check_output(
+            [sys.executable, WORKER_PATH, binary, out_path, mode]
+            + [str(a) for a in worker_args],
+            f"benchmark {mode}",
+            binary,
+        )
+        with open(out_path) as f:
+            return json.loads(f.read())
+
+
+def benchmark(unstripped, stripped):
+    is_msvc = stripped.endswith(".pdb")
+    source = unstripped if is_msvc else stripped
+    rel_path = Path(unstripped).relative_to(TARGET_PATH)
+    sets = sig_sets(source, rel_path)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as work_dir:
+        # IDA puts the database next to the binary
+        binary = Path(work_dir) / Path(source).name
+        shutil.copy(source, binary)
+        snapshot = binary.with_suffix(".snapshot.i64")
+        prepared = run_worker(binary, "prepare", snapshot)
+
+        results = {}
+        for name, sigs in sets.items():
+            # Fresh process per set so its first run is actually cold
+            runs = run_worker(snapshot, "apply", args.warm, *sigs)["runs"]
+            results[name] = {
+                "sigs": len(sigs),
+                "sig_bytes": sum(sig.stat().st_size for sig in sigs),
+                "cold": runs[0],
+                "warm": runs[1:],
+            }
+            print(f"  {name}: {summarize(results[name])}")
+    return prepared, results
+
+
+def median_warm(result):
+    runs = result["warm"] or [result["cold"]]
+    return statistics.median(run["total"] for run in runs)
+
+
+def summarize(result):
+    return (
+        f"{result['cold']['total']:.2f}s cold, {median_warm(result):.2f}s warm, "
+        f"{result['cold']['matches']} matches ({result['sigs']} sigs)"
+    )
+
+
+def compare(old, new, threshold):
+    print(f"Comparing {old['rust_sig_gen']} -> {new['rust_sig_gen']}")
+    for binary, result in new["binaries"].items():
+        old_sets = old["binaries"].get(binary, {}).get("sets", {})
+        for name, new_set in result["sets"].items():
+            if name not in old_sets:
+                continue
+            before, after = median_warm(old_sets[name]), median_warm(new_set)
+            ratio = after / before if before else float("inf")
+            marker = "  <-- slower" if ratio > 1 + threshold else ""
+            print(f"  {binary} ({name}): {before:.2f}s -> {after:.2f}s ({ratio:.2f}x){marker}")
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "filter", nargs="?", help="optional regex to filter which binaries to consider"
+)
+parser.add_argument(
+    "--sets",
+    nargs="+",
+    choices=SIG_SETS,
+    default=SIG_SETS,
+    help="signature sets to benchmark (crate sets only for binaries with crate signatures)",
+)
+parser.add_argument(
+    "--warm", type=int, default=3, help="number of warm runs after the cold one"
+)
+parser.add_argument(
+    "--out",
+    type=Path,
+    help="where to write the results (default: one file per RustSigGen version in target/benchmarks)",
+)
+parser.add_argument(
+    "--compare",
+    type=Path,
+    help="previous results to compare against; flags binaries which got slower",
+)
+parser.add_argument(
+    "--threshold",
+    type=float,
+    default=0.1,
+    help="relative slowdown which gets flagged by --compare",
+)
+args = parser.parse_args()
+
+binaries = select(exclude=["uniqueness"])
+
+version = rust_sig_gen_version()
+results = {
+    "version": BENCHMARK_VERSION,
+    "rust_sig_gen": version,
+    "flair": flair_version(),
+    "ida": None,
+    "date": datetime.now(timezone.utc).isoformat(),
+    "warm_runs": args.warm,
+    "binaries": {},
+}
+
+# Sequentially so the measurements don't compete for CPU/IO
+for unstripped, stripped in binaries.items():
+    if args.filter and not re.search(args.filter, unstripped):
+        continue
+    print(unstripped)
+    prepared, sets = benchmark(unstripped, stripped)
+    results["ida"] = prepared["ida_version"]
+    results["binaries"][unstripped] = {"analysis": prepared["analysis"], "sets": sets}
+
+version_slug = re.sub(r"[^\w.-]+", "_", version)
+out_path = args.out or BENCHMARKS_PATH / f"sigs-{version_slug}.json"
+out_path.parent.mkdir(parents=True, exist_ok=True)
+with open(out_path, "w") as f:
+    f.write(json.dumps(results))
+print(f"Results written to {out_path}")
+
+if args.compare:
+    with open(args.compare) as f:
+        old = json.loads(f.read())
+    if old["version"] != BENCHMARK_VERSION:
+        sys.exit(f"{args.compare} uses an incompatible benchmark version ({old['version']})")
+    compare(old, results, args.threshold)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import time
+
+import idapro
+import ida_auto
+import ida_funcs
+import ida_kernwin
+
+from ida_snapshot import open_snapshot, save_snapshot
+
+# Single idalib process of benchmark_sigs.py
+# Usage: benchmark_worker.py <binary> <out.json> prepare <snapshot>
+#        benchmark_worker.py <snapshot> <out.json> apply <warm runs> <sig>...
+#
+# `prepare` auto-analyzes the binary once and saves the result as a snapshot. `apply` then applies a
+# signature set to fresh copies of that snapshot: The first run in the process is the cold one (IDA
+# hasn't loaded any signature yet), all following ones are warm.
+
+
+def prepare(binary, snapshot):
+    started = time.monotonic()
+    # Like the evaluation don't load the .pdb of MSVC binaries
+    assert idapro.open_database(binary, True, "-Opdb:off") == 0
+    analysis = time.monotonic() - started
+    save_snapshot(snapshot)
+    return {"analysis": analysis, "ida_version": ida_kernwin.get_kernel_version()}
+
+
+def apply_sigs(snapshot, sigs):
+    with open_snapshot(snapshot):
+        started = time.monotonic()
+        cpu = time.process_time()
+        for sig in sigs:
+            ida_funcs.plan_to_apply_idasgn(sig)
+        planned = time.monotonic()
+        # Signatures get applied while the auto-analysis works through its queues; this includes
+        # the reanalysis of everything the signatures renamed or retyped
+        ida_auto.auto_wait()
+        finished = time.monotonic()
+
+        matches = 0
+        for index in range(ida_funcs.get_idasgn_qty()):
+            fname, _, fmatches = ida_funcs.get_idasgn_desc_with_matches(index)
+            if any(fname in sig for sig in sigs):
+                matches += fmatches
+
+    return {
+        "plan": planned - started,
+        "auto_wait": finished - planned,
+        "total": finished - started,
+        "cpu": time.process_time() - cpu,
+        "matches": matches,
+    }
+
+
+binary, out_path, mode = sys.argv[1:4]
+if mode == "prepare":
+    result = prepare(binary, sys.argv[4])
+else:
+    warm_runs, sigs = int(sys.argv[4]), sys.argv[5:]
+    result = {"runs": [apply_sigs(binary, sigs) for _ in range(1 + warm_runs)]}
+
+with open(out_path, "w") as f:
+    f.write(json.dumps(result))
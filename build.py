@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 
+import argparse
+import functools
+import hashlib
 import json
 import os
 import shutil
 import subprocess
-from io import BytesIO
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import requests
-from pyzipper import AESZipFile
 from tomlkit.toml_file import TOMLFile
 
+import metrics
+from artifact_store import BLOBS_PATH, add_blob, link_blob
+from malware_fetcher import add_malware_arguments, fetch_samples
+from registry import REGISTRY_PATH, write_registry
 from shared import TARGET_PATH
 
 # NOTE: Need to use git version of cargo-xwin until there's a release with https://github.com/rust-cross/cargo-xwin/commit/13af95154fce77793001b29b8afc06b73dd0c879
@@ -53,79 +59,314 @@ VERSIONS_UNIQUENESS = [
 ]
 BIN_UNIQUENESS = "hello_world"
 
+BUILD_LOGS_PATH = TARGET_PATH / "build_logs"
+BUILD_CACHE_PATH = TARGET_PATH / "build_cache"
+# Environment variables which influence the produced binaries and are thus part of the cache key
+BUILD_CACHE_ENV = ["XWIN_ARCH", "XWIN_INCLUDE_DEBUG_SYMBOLS", "RUSTFLAGS"]
+
+OSS_PROJECTS_PATH = Path("oss_projects")
+
+# https://github.com/cxiao/rust-malware-gallery
+# NOTE: Sources to consider: https://bazaar.abuse.ch; https://malshare.com
+# TODO: Add comments about which target each sample uses
+MALWARE = [
+    (
+        "37c52481711631a5c73a6341bd8bea302ad57f02199db7624b580058547fb5a9",
+        "spica.exe",
+    ),
+    (
+        "f8c08d00ff6e8c6adb1a93cd133b19302d0b651afd73ccb54e3b6ac6c60d99c6",
+        "blackcat.elf",
+    ),
+    (
+        "7bb383b31d1b415bc067e612203cc6bda53e914f7ca5291299e92f59d47cabf8",
+        "blackcat.exe",
+    ),
+    (
+        "35d8eb3a18f55806333f187f295df747150048c5cdd011acba9e294fa57ad991",
+        "rustystealer.exe",
+    ),
+    (
+        "030eb56e155fb01d7b190866aaa8b3128f935afd0b7a7b2178dc8e2eb84228b0",
+        "krustyloader.elf",
+    ),
+]
+
+# Failed matrix cells and malware samples as `(description, exception)`; reported at the end
+build_failures = []
+# Map: artifact path in target/ -> sha256 of its content
+artifact_hashes = {}
+
+
+# Minimal GNU make style jobserver shared by all concurrently running cargo processes. Cargo (and
+# the rustc processes it spawns) pick it up via `CARGO_MAKEFLAGS` so the total number of jobs stays
+# bounded no matter how many matrix cells are being built at the same time.
+class Jobserver:
+    def __init__(self, jobs, clients):
+        self.jobs = jobs
+        self.read_fd, self.write_fd = os.pipe()
+        # Every client implicitly owns one token so only hand out the remaining ones
+        os.write(self.write_fd, b"+" * max(jobs - clients, 0))
+
+    def env(self):
+        auth = f"{self.read_fd},{self.write_fd}"
+        flags = f"-j{self.jobs} --jobserver-fds={auth} --jobserver-auth={auth}"
+        return {"CARGO_MAKEFLAGS": flags, "MAKEFLAGS": flags}
+
+    def fds(self):
+        return (self.read_fd, self.write_fd)
+
+
+@functools.cache
+def hash_toolchain(version):
+    # `-vV` includes the commit hash and LLVM version so this changes whenever a channel (e.g.
+    # nightly) gets updated under the same name
+    return hashlib.sha256(
+        metrics.check_output(["rustc", f"+{version}", "-vV"], "rustc -vV", detail=version)
+    ).hexdigest()
+
+
+# Beta/nightly toolchains are newer than any stable release of the matrix
+def version_order(version):
+    try:
+        return tuple(int(part) for part in version.split("."))
+    except ValueError:
+        return (float("inf"),)
+
+
+# Resolves the dependencies of a package once before any of its cells get built. The builds run
+# with `--locked` so cargo never rewrites Cargo.lock (which is part of the build cache key) while
+# concurrent cells are hashing it. The oldest toolchain resolves it since newer cargo versions
+# keep and can read older lockfile versions but not the other way around.
+def resolve_lockfile(crate_dir, versions):
+    if (crate_dir / "Cargo.lock").exists():
+        return
+    version = min(versions, key=version_order)
+    metrics.check_call(
+        ["cargo", f"+{version}", "generate-lockfile"],
+        "cargo generate-lockfile",
+        detail=str(crate_dir),
+        cwd=crate_dir,
+    )
+
 
-def build_and_copy_to_target(crate_dir, version, target, mode, bins, binaries):
+def hash_crate_sources(crate_dir):
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(crate_dir):
+        # Skip build outputs and VCS metadata; Cargo.lock (see `resolve_lockfile()`) is picked up
+        # like any other source file
+        dirs[:] = sorted(d for d in dirs if d not in ("target", ".git"))
+        for name in sorted(files):
+            path = Path(root) / name
+            h.update(str(path.relative_to(crate_dir)).encode() + b"\0")
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def build_cache_key(crate_dir, version, target, profile, bins, env):
+    key = {
+        "sources": hash_crate_sources(crate_dir),
+        "toolchain": hash_toolchain(version),
+        "target": target,
+        "profile": profile,
+        "bins": sorted(bins),
+        "env": {k: env.get(k) for k in BUILD_CACHE_ENV},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+# Hashes of a build cache entry's artifacts (which are all in the artifact store)
+def cached_artifact_hashes(cache_dir):
+    hashes_path = cache_dir / "hashes.json"
+    if not hashes_path.exists():
+        # Cache entry from before the artifact store
+        hashes = {p.name: add_blob(p) for p in sorted(cache_dir.iterdir())}
+        hashes_path.write_text(json.dumps(hashes))
+    return json.loads(hashes_path.read_text())
+
+
+def build_and_copy_to_target(
+    crate_dir, version, target, mode, bins, binaries, jobserver=None, log=None
+):
     bin_ext = ".exe" if "windows" in target else ""
     profile = "release" if mode == "release" else "dev"
     is_msvc = target.endswith("-msvc")
-    cargo_command = [
-        "cargo",
-        f"+{version}",
-        "xwin" if is_msvc else None,
-        "build",
-        "--profile",
-        profile,
-        "--target",
-        target,
-    ]
-    # NOTE: If building fails with strange linker errors when targeting MSVC try removing
-    #       cargo-xwin's cache: `rm -r ~/.cache/cargo-xwin/`
-    subprocess.check_call(
-        [x for x in cargo_command if x],
-        cwd=crate_dir,
-        env=dict(os.environ, XWIN_INCLUDE_DEBUG_SYMBOLS="true", XWIN_ARCH="x86,x86_64"),
-    )
+    env = dict(os.environ, XWIN_INCLUDE_DEBUG_SYMBOLS="true", XWIN_ARCH="x86,x86_64")
+
+    # Artifacts are cached by all inputs which influence the build so unchanged cells don't need
+    # to invoke cargo/strip at all
+    cache_key = build_cache_key(crate_dir, version, target, profile, bins, env)
+    cache_dir = BUILD_CACHE_PATH / cache_key
+    if cache_dir.exists():
+        print(f"Using cached build of {crate_dir} ({version}, {target}, {mode})", file=log)
+    else:
+        # Every (version, target, mode) cell gets its own target directory so concurrent builds
+        # never block on (or clobber) each other's build directory lock
+        cell_target_dir = crate_dir / "target" / "cells" / version / target / mode
+        cargo_command = [
+            "cargo",
+            f"+{version}",
+            "xwin" if is_msvc else None,
+            "build",
+            "--locked",
+            "--profile",
+            profile,
+            "--target",
+            target,
+            "--target-dir",
+            cell_target_dir.absolute(),
+        ]
+        if jobserver:
+            env |= jobserver.env()
+        # NOTE: If building fails with strange linker errors when targeting MSVC try removing
+        #       cargo-xwin's cache: `rm -r ~/.cache/cargo-xwin/`
+        metrics.check_call(
+            [x for x in cargo_command if x],
+            "cargo build",
+            TARGET_PATH / version / target / mode,
+            detail=crate_dir.name,
+            cwd=crate_dir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT if log else None,
+            pass_fds=jobserver.fds() if jobserver else (),
+        )
 
-    for binary in bins:
-        common = f"{target}/{mode}/{binary}{bin_ext}"
-        in_path = crate_dir / "target" / common
-        out_path = TARGET_PATH / version / common
+        # Populate a temporary directory first so an interrupted build never leaves behind a
+        # partial cache entry
+        tmp_dir = cache_dir.with_name(cache_key + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        for binary in bins:
+            name = f"{binary}{bin_ext}"
+            in_path = cell_target_dir / target / mode / name
+            shutil.copy(in_path, tmp_dir / name)
+
+            # Don't need to strip MSVC binaries since their debug info is external
+            # anyways; MinGW binaries do use DWARF though!
+            if is_msvc:
+                # Instead copy the `.pdb` so we have ground-truth data. We can disable
+                # loading of the debug info via `-Opdb:off` in the CLI.
+                shutil.copy(in_path.with_suffix(".pdb"), tmp_dir / f"{binary}.pdb")
+            else:
+                metrics.check_output(
+                    ["strip", "-o", tmp_dir / f"{name}.stripped", in_path],
+                    "strip",
+                    TARGET_PATH / version / target / mode / name,
+                )
+        cached_artifact_hashes(tmp_dir)
+        tmp_dir.rename(cache_dir)
+
+    # The outputs in target/ are hardlinks into the artifact store instead of copies
+    hashes = cached_artifact_hashes(cache_dir)
 
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy(in_path, out_path)
+    def link_artifact(name, out_path):
+        if not (BLOBS_PATH / hashes[name]).exists():
+            add_blob(cache_dir / name)
+        link_blob(hashes[name], out_path)
+        artifact_hashes[out_path] = hashes[name]
+
+    for binary in bins:
+        name = f"{binary}{bin_ext}"
+        out_path = TARGET_PATH / version / target / mode / name
+        link_artifact(name, out_path)
 
-        # Don't need to strip MSVC binaries since their debug info is external
-        # anyways; MinGW binaries do use DWARF though!
         if is_msvc:
-            # Instead copy the `.pdb` so we have ground-truth data. We can disable
-            # loading of the debug info via `-Opdb:off` in the CLI.
-            shutil.copy(in_path.with_suffix(".pdb"), out_path.with_suffix(".pdb"))
+            link_artifact(f"{binary}.pdb", out_path.with_suffix(".pdb"))
             binaries[out_path] = out_path.with_suffix(".pdb")
         else:
             out_path_stripped = out_path.with_suffix(out_path.suffix + ".stripped")
-            subprocess.check_output(["strip", "-o", out_path_stripped, out_path])
+            link_artifact(f"{name}.stripped", out_path_stripped)
             binaries[out_path] = out_path_stripped
 
 
-def build_examples():
+def build_cell(cell, jobserver):
+    crate_dir, version, target, mode, bins = cell
+    log_path = BUILD_LOGS_PATH / version / f"{crate_dir.name}-{target}-{mode}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
     binaries = {}
-    examples_dir = Path("examples")
-    metadata_json = subprocess.check_output(
-        ["cargo", "metadata", "--format-version", "1"],
-        cwd=examples_dir,
+    with open(log_path, "w") as log:
+        try:
+            build_and_copy_to_target(
+                crate_dir, version, target, mode, bins, binaries, jobserver, log
+            )
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"{e} (see {log_path})") from e
+    return binaries
+
+
+# Builds all cells concurrently. Failed cells are collected in `build_failures` and reported at the
+# end instead of aborting the whole matrix.
+def build_matrix(cells, jobs, max_cells):
+    for crate_dir in dict.fromkeys(cell[0] for cell in cells):
+        resolve_lockfile(crate_dir, [cell[1] for cell in cells if cell[0] == crate_dir])
+    jobserver = Jobserver(jobs, max_cells)
+    with ThreadPoolExecutor(max_cells) as executor:
+        futures = [(cell, executor.submit(build_cell, cell, jobserver)) for cell in cells]
+
+        # Merge in submission order so the registry stays deterministic
+        binaries = {}
+        for (crate_dir, version, target, mode, _), future in futures:
+            try:
+                binaries |= future.result()
+                print(f"Built {crate_dir} ({version}, {target}, {mode})")
+            except Exception as e:
+                print(f"Failed {crate_dir} ({version}, {target}, {mode}): {e}")
+                build_failures.append((f"{crate_dir} ({version}, {target}, {mode})", e))
+    os.close(jobserver.read_fd)
+    os.close(jobserver.write_fd)
+    return binaries
+
+
+def get_bins(crate_dir):
+    metadata_json = metrics.check_output(
+        # Without resolving the dependencies so Cargo.lock doesn't get written here
+        ["cargo", "metadata", "--no-deps", "--format-version", "1"],
+        "cargo metadata",
+        detail=str(crate_dir),
+        cwd=crate_dir,
     )
     metadata = json.loads(metadata_json.decode())
-    bins = [t["name"] for t in metadata["packages"][0]["targets"]]
+    return [t["name"] for t in metadata["packages"][0]["targets"]]
+
+
+# Output paths of a cell; Map: unstripped bin -> stripped bin (or .pdb for MSVC)
+def cell_outputs(cell):
+    _, version, target, mode, bins = cell
+    bin_ext = ".exe" if "windows" in target else ""
+    outputs = {}
+    for binary in bins:
+        out_path = TARGET_PATH / version / target / mode / f"{binary}{bin_ext}"
+        if target.endswith("-msvc"):
+            outputs[out_path] = out_path.with_suffix(".pdb")
+        else:
+            outputs[out_path] = out_path.with_suffix(out_path.suffix + ".stripped")
+    return outputs
+
+
+def examples_cells():
+    examples_dir = Path("examples")
+    bins = get_bins(examples_dir)
     print("Example binaries:", bins)
 
+    cells = []
     for version in VERSIONS:
         for target in TARGETS:
             for mode in ["debug", "release"]:
-                build_and_copy_to_target(
-                    examples_dir, version, target, mode, bins, binaries
-                )
-    return binaries
+                cells.append((examples_dir, version, target, mode, bins))
+    return cells
+
+
+def build_examples(jobs, max_cells):
+    return build_matrix(examples_cells(), jobs, max_cells)
 
 
 def build_std_generic_example():
     binaries = {}
     examples_dir = Path("std_generic_example")
-    metadata_json = subprocess.check_output(
-        ["cargo", "metadata", "--format-version", "1"],
-        cwd=examples_dir,
-    )
-    metadata = json.loads(metadata_json.decode())
-    bins = [t["name"] for t in metadata["packages"][0]["targets"]]
+    bins = get_bins(examples_dir)
+    resolve_lockfile(examples_dir, [VERSIONS[0]])
 
     build_and_copy_to_target(
         examples_dir, VERSIONS[0], TARGETS[0], "debug", bins, binaries
@@ -133,60 +374,70 @@ def build_std_generic_example():
     return binaries
 
 
-def build_examples_uniqueness():
-    binaries = {}
-    for version in VERSIONS_UNIQUENESS:
-        build_and_copy_to_target(
-            Path("examples"), version, TARGETS[0], "release", [BIN_UNIQUENESS], binaries
-        )
-    return binaries
+def uniqueness_cells():
+    return [
+        (Path("examples"), version, TARGETS[0], "release", [BIN_UNIQUENESS])
+        for version in VERSIONS_UNIQUENESS
+    ]
 
 
-def build_oss_projects():
-    binaries = {}
-    base_dir = Path("oss_projects")
-    projects = [p.name for p in base_dir.glob("*")]
+def build_examples_uniqueness(jobs, max_cells):
+    return build_matrix(uniqueness_cells(), jobs, max_cells)
+
+
+def oss_cells():
+    projects = [p.name for p in OSS_PROJECTS_PATH.glob("*")]
     print("OSS Projects:", projects)
 
+    cells = []
+    for proj in projects:
+        bins = ["rg" if proj == "ripgrep" else proj]
+        for mode in ["debug", "release"]:
+            cells.append((OSS_PROJECTS_PATH / proj, VERSIONS[0], TARGETS[0], mode, bins))
+    return cells
+
+
+def prepare_oss_project(proj_dir):
     # If Cargo.toml is not in root directory
     special_toml_paths = {"resvg": "crates/resvg/Cargo.toml"}
 
-    for proj in projects:
-        for mode in ["debug", "release"]:
-            version = VERSIONS[0]
-            target = TARGETS[0]
-            bins = ["rg" if proj == "ripgrep" else proj]
-            proj_dir = base_dir / proj
-
-            # Reset repo
-            subprocess.check_call(["git", "reset", "--hard"], cwd=proj_dir)
-
-            toml_path = proj_dir / "Cargo.toml"
-            if proj in special_toml_paths:
-                toml_path = proj_dir / special_toml_paths[proj]
-
-            # Remove path dependencies (so crates.io versions get used)
-            # NOTE: We do this since we want to evaluate how well we can recognize functions in
-            #       dependencies and local path dependencies can't be recognized. On the other hand
-            #       if the final crate is just a thin facade for a dependency which contains most of
-            #       the actual implementation this will tell us nothing...
-            f = TOMLFile(toml_path)
-            cargo_toml = f.read()
-            for k, v in cargo_toml["dependencies"].items():
-                if "version" in v and "path" in v:
-                    del v["path"]
-                    print(f"Removed path dependency on crate {k}.")
-            f.write(cargo_toml)
-
-            build_and_copy_to_target(proj_dir, version, target, mode, bins, binaries)
-    return binaries
+    # Reset repo
+    metrics.check_call(
+        ["git", "reset", "--hard"], "git reset", detail=proj_dir.name, cwd=proj_dir
+    )
+
+    toml_path = proj_dir / "Cargo.toml"
+    if proj_dir.name in special_toml_paths:
+        toml_path = proj_dir / special_toml_paths[proj_dir.name]
+
+    # Remove path dependencies (so crates.io versions get used)
+    # NOTE: We do this since we want to evaluate how well we can recognize functions in
+    #       dependencies and local path dependencies can't be recognized. On the other hand
+    #       if the final crate is just a thin facade for a dependency which contains most of
+    #       the actual implementation this will tell us nothing...
+    f = TOMLFile(toml_path)
+    cargo_toml = f.read()
+    for k, v in cargo_toml["dependencies"].items():
+        if "version" in v and "path" in v:
+            del v["path"]
+            print(f"Removed path dependency on crate {k}.")
+    f.write(cargo_toml)
+
+
+def build_oss_projects(jobs, max_cells):
+    cells = oss_cells()
+    for proj_dir in {cell[0] for cell in cells}:
+        prepare_oss_project(proj_dir)
+    return build_matrix(cells, jobs, max_cells)
 
 
 # NOTE: Binaries built in a Windows VM
 def copy_real_windows_binaries():
     binaries = {}
-    metadata_json = subprocess.check_output(
+    metadata_json = metrics.check_output(
         ["cargo", "metadata", "--format-version", "1"],
+        "cargo metadata",
+        detail="examples",
         cwd="examples",
     )
     metadata = json.loads(metadata_json.decode())
@@ -217,61 +468,23 @@ def copy_real_windows_binaries():
     return binaries
 
 
-def get_malware_samples():
-    # https://github.com/cxiao/rust-malware-gallery
-    # NOTE: Sources to consider: https://bazaar.abuse.ch; https://malshare.com
-    # TODO: Add comments about which target each sample uses
-    MALWARE = [
-        (
-            "37c52481711631a5c73a6341bd8bea302ad57f02199db7624b580058547fb5a9",
-            "spica.exe",
-        ),
-        (
-            "f8c08d00ff6e8c6adb1a93cd133b19302d0b651afd73ccb54e3b6ac6c60d99c6",
-            "blackcat.elf",
-        ),
-        (
-            "7bb383b31d1b415bc067e612203cc6bda53e914f7ca5291299e92f59d47cabf8",
-            "blackcat.exe",
-        ),
-        (
-            "35d8eb3a18f55806333f187f295df747150048c5cdd011acba9e294fa57ad991",
-            "rustystealer.exe",
-        ),
-        (
-            "030eb56e155fb01d7b190866aaa8b3128f935afd0b7a7b2178dc8e2eb84228b0",
-            "krustyloader.elf",
-        ),
-    ]
-    ZIP_PASSWORD = b"infected"
-
-    binaries = {}
-    for hash, name in MALWARE:
-        out_path = TARGET_PATH / "malware" / f"{name}.do_not_exec"
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-
-        binaries[out_path] = out_path
-        if out_path.exists():
-            continue
-
-        data = requests.post(
-            "https://mb-api.abuse.ch/api/v1/",
-            data={"query": "get_file", "sha256_hash": hash},
-        ).content
-
-        data = BytesIO(data)
-        with AESZipFile(data, "r") as zip_file:
-            with open(out_path, "wb") as f:
-                extraceted_bytes = zip_file.read(zip_file.filelist[0], pwd=ZIP_PASSWORD)
-                f.write(extraceted_bytes)
-    return binaries
+# See malware_fetcher.py; `source` is a MalwareBazaar compatible API or directory mirror. Failed
+# samples are collected in `build_failures` so the fetched ones still get registered.
+def get_malware_samples(source=None, jobs=8):
+    paths, failures = fetch_samples(MALWARE, TARGET_PATH / "malware", source, jobs)
+    for name, sha256, e in failures:
+        print(f"Failed to fetch {name} ({sha256}): {e}")
+        build_failures.append((f"malware sample {name} ({sha256})", e))
+    artifact_hashes.update(paths)
+    # Samples aren't stripped further
+    return {path: path for path in paths}
 
 
 def prepare_toolchains():
     print("Preparing toolchains...")
 
     installed_versions = (
-        subprocess.check_output(["rustup", "toolchain", "list"])
+        metrics.check_output(["rustup", "toolchain", "list"], "rustup")
         .decode()
         .strip()
         .split("\n")
@@ -286,45 +499,71 @@ def prepare_toolchains():
         installed_versions
     )
     for version in missing_versions:
-        subprocess.check_output(
-            ["rustup", "toolchain", "install", version, "--profile", "minimal"]
+        metrics.check_output(
+            ["rustup", "toolchain", "install", version, "--profile", "minimal"],
+            "rustup",
+            detail=version,
         )
 
     # Install targets (if missing)
     for version in VERSIONS:
-        subprocess.check_output(
+        metrics.check_output(
             ["rustup", f"+{version}", "target", "add"] + TARGETS,
+            "rustup",
+            detail=version,
             stderr=subprocess.DEVNULL,
         )
 
 
-TARGET_PATH.mkdir(exist_ok=True)
-prepare_toolchains()
-
-# TODO: Other way around would be better since we don't always have an unstripped bin
-# Map: unstripped bin -> stripped bin
-categories = {
-    "examples": build_examples(),
-    # NOTE: Disabled since the binaries need updating and there's no good way to automate this
-    #       process; The results are effectively the same as with cargo-xwin anyways...
-    # "real_windows": copy_real_windows_binaries(),
-    "oss_projects": build_oss_projects(),
-    "malware_samples": get_malware_samples(),
-    "uniqueness": build_examples_uniqueness(),
-}
-
-json_struct = {}
-total = 0
-for category, binaries in categories.items():
-    json_struct[category] = {str(k): str(v) for k, v in binaries.items()}
-    print(f"{category}: {len(binaries)} binaries")
-    total += len(binaries)
-print(f"Total: {total} binaries")
-
-with open(TARGET_PATH / "binaries.json", "w") as f:
-    f.write(json.dumps(json_struct))
-
-# These are not part of the evalation and are just used as an example in the thesis
-std_generic_example = build_std_generic_example()
-print("std_generic_example:", [str(p) for p in std_generic_example.values()])
-# print("std_generic_example", str(build_std_generic_example()))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="total number of jobs shared by all concurrently running cargo processes",
+    )
+    parser.add_argument(
+        "--cells",
+        type=int,
+        default=4,
+        help="maximum number of (version, target, mode) cells to build concurrently",
+    )
+    add_malware_arguments(parser)
+    args = parser.parse_args()
+
+    TARGET_PATH.mkdir(exist_ok=True)
+    prepare_toolchains()
+
+    # TODO: Other way around would be better since we don't always have an unstripped bin
+    # Map: unstripped bin -> stripped bin
+    categories = {
+        "examples": build_examples(args.jobs, args.cells),
+        # NOTE: Disabled since the binaries need updating and there's no good way to automate this
+        #       process; The results are effectively the same as with cargo-xwin anyways...
+        # "real_windows": copy_real_windows_binaries(),
+        "oss_projects": build_oss_projects(args.jobs, args.cells),
+        "malware_samples": get_malware_samples(args.malware_source, args.fetch_jobs),
+        "uniqueness": build_examples_uniqueness(args.jobs, args.cells),
+    }
+
+    total = 0
+    for category, binaries in categories.items():
+        print(f"{category}: {len(binaries)} binaries")
+        total += len(binaries)
+    print(f"Total: {total} binaries")
+
+    write_registry(categories, artifact_hashes)
+    print(f"Wrote {REGISTRY_PATH}")
+
+    # These are not part of the evalation and are just used as an example in the thesis
+    std_generic_example = build_std_generic_example()
+    print("std_generic_example:", [str(p) for p in std_generic_example.values()])
+    # print("std_generic_example", str(build_std_generic_example()))
+
+    if build_failures:
+        print(f"{len(build_failures)} build(s) failed:")
+        for description, e in build_failures:
+            print(f"  {description}: {e}")
+        sys.exit(1)
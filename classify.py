@@ -0,0 +1,204 @@
+import hashlib
+import re
+from collections import Counter
+from importlib.metadata import version
+
+from demangle_cache import DemangleCache
+from names import clean_name
+from symbol_dump import open_dump
+
+# `real_name``: `matched_name``
+ALLOWED_ALIASES = {
+    "_start": "start",
+    "mainCRTStartup": "start",
+    # These are just thunks which aren't in the signature library (too small) but get auto-named by
+    # IDA. We recognize the actual jump target so these should count too.
+    ## Linux
+    "__rust_alloc": "j___rdl_alloc",
+    "__rust_dealloc": "j___rdl_dealloc",
+    "__rust_realloc": "j___rdl_realloc",
+    "__rust_alloc_zeroed": "j___rdl_alloc_zeroed",
+    "__rust_alloc_error_handler": "j___rg_oom",
+    "_alloca_probe": "__alloca_probe",
+    "rust_alloc_zeroed": "j___rdl_alloc_zeroed",
+    ## MSVC
+    "rust_alloc": "j___rdl_alloc",
+    "rust_dealloc": "j___rdl_dealloc",
+    "rust_realloc": "j___rdl_realloc",
+    "rust_alloc_error_handler": "j___rg_oom",
+    # Language items which are special in regards to linkage
+    "std::alloc::__default_lib_allocator::__rdl_alloc": "__rdl_alloc",
+    "std::alloc::__default_lib_allocator::__rdl_dealloc": "__rdl_dealloc",
+    "std::alloc::__default_lib_allocator::__rdl_realloc": "__rdl_realloc",
+    "std::alloc::__default_lib_allocator::__rdl_alloc_zeroed": "__rdl_alloc_zeroed",
+    "std::panicking::rust_panic": "rust_panic",
+    "std::sys::personality::gcc::rust_eh_personality": "rust_eh_personality",
+    "std::alloc::_::__rg_oom": "__rg_oom",
+    "panic_unwind::__rust_panic_cleanup": "__rust_panic_cleanup",
+    "panic_unwind::__rust_start_panic": "__rust_start_panic",
+}
+
+# Bump whenever the classification logic (or the format of its results) changes so cached summaries
+# get invalidated
+CLASSIFICATION_VERSION = 3
+
+CATEGORIES = ["matched", "different_hash", "sig_collision", "wrong", "missed", "unknown"]
+# Categories which count as correctly recognized
+OK_CATEGORIES = ["matched", "different_hash", "sig_collision"]
+
+AT_SUFFIX_RE = re.compile(r"@\d+$")
+
+# One per worker process; SQLite connections can't be shared across a fork
+demangle_cache = None
+
+
+def remove_at_suffix(symbol: str):
+    return AT_SUFFIX_RE.sub("", symbol)
+
+
+# Joins the reference and matched names on their address into aligned columns (sizes are those of
+# the reference functions; `None` for dumps without sizes)
+def join_columns(reference, matched_dump):
+    addrs, sizes, real, matched = [], [], [], []
+    for i, j in reference.join_indices(matched_dump):
+        addrs.append(reference.addresses[i])
+        sizes.append(reference.size(i))
+        real.append(clean_name(reference.name(i)))
+        matched.append(clean_name(matched_dump.name(j)))
+    return addrs, sizes, real, matched
+
+
+# Classifies all symbol pairs at once and returns one of `CATEGORIES` for each of them
+def classify(real, matched):
+    return classify_demangled(real, matched)[0]
+
+
+# Like `classify()` but also returns the demangled real and matched names which were compared
+def classify_demangled(real, matched):
+    global demangle_cache
+    if demangle_cache is None:
+        demangle_cache = DemangleCache()
+
+    # Demangle all unique names of the binary in a single batch
+    symbols = list(set(real) | set(matched))
+    forms = dict(zip(symbols, demangle_cache.demangle_batch(symbols)))
+    real_forms = [forms[name] for name in real]
+    matched_forms = [forms[name] for name in matched]
+
+    # Use the MSVC demangling if the matched name uses MSVC symbol mangling. Remove trailing `@n`
+    # suffix which gets added by IDA for i686 binaries (ref: https://stackoverflow.com/a/68767175)
+    form_index = [2 if name.startswith("?") else 0 for name in matched]
+    real_demangled = [remove_at_suffix(f[i]) for f, i in zip(real_forms, form_index)]
+    matched_demangled = [remove_at_suffix(f[i]) for f, i in zip(matched_forms, form_index)]
+
+    real_dummy = [name.startswith("sub_") for name in real]
+    matched_dummy = [name.startswith("sub_") for name in matched]
+
+    categories = []
+    for i in range(len(real)):
+        # Sometimes symbols are missing even in the unstripped binary
+        if real_dummy[i] and matched_dummy[i]:
+            categories.append("unknown")
+        elif (
+            real_demangled[i] == matched_demangled[i]
+            or "__" + real_demangled[i] == matched_demangled[i]
+            or (real_dummy[i] and not matched_dummy[i])
+            or ALLOWED_ALIASES.get(real[i]) == matched[i]
+        ):
+            categories.append("matched")
+        elif real_forms[i][1] == matched_forms[i][1]:
+            # Demangled names without the function hash suffix are the same
+            categories.append("different_hash")
+        elif matched[i].startswith("unknown_libname_"):
+            categories.append("sig_collision")
+        elif matched_dummy[i]:
+            categories.append("missed")
+        else:
+            categories.append("wrong")
+    return categories, real_demangled, matched_demangled
+
+
+# Key over everything `summarize()` depends on: the content of the input dumps, the classification
+# logic and the demangler
+def summary_key(unstripped, stripped, out_path, matched_extension):
+    h = hashlib.sha256(f"{CLASSIFICATION_VERSION} {version('rustc_demangle_py')}".encode())
+    inputs = [f"{out_path}.{matched_extension}"]
+    if unstripped != stripped:
+        inputs.insert(0, f"{out_path}.reference")
+    for path in inputs:
+        try:
+            with open(path, "rb") as f:
+                h.update(hashlib.file_digest(f, "sha256").digest())
+        except FileNotFoundError:
+            h.update(b"missing")
+    return h.hexdigest()
+
+
+# Computes the statistics for a single binary. Returns the lines to print, the binary's entry in
+# the thesis data (or `None` if there's no evaluation result) and the classified symbols (see
+# results_db.py; empty without reference symbols).
+def summarize(unstripped, stripped, out_path, matched_extension):
+    lines = [unstripped]
+
+    if unstripped != stripped:
+        # E.g. the binary failed to build or one of its IDA jobs failed
+        try:
+            reference = open_dump(f"{out_path}.reference")
+            matched_dump = open_dump(f"{out_path}.{matched_extension}")
+        except FileNotFoundError:
+            return lines, None, []
+
+        addrs, sizes, real, matched = join_columns(reference, matched_dump)
+        categories, real_demangled, matched_demangled = classify_demangled(real, matched)
+        symbols = list(
+            zip(addrs, sizes, real, matched, real_demangled, matched_demangled, categories)
+        )
+        counts = Counter(categories)
+        total = len(reference)
+
+        ok = sum(counts[c] for c in OK_CATEGORIES)
+        if reference.is_native():
+            lines.append("  Native reference: no `sub_...` functions in total/unknown")
+        lines.append(
+            f"  {ok} / {total} (matched: {counts['matched']}, different_hash: {counts['different_hash']}, sig_collision: {counts['sig_collision']}, wrong: {counts['wrong']}, missed: {counts['missed']}, unknown: {counts['unknown']})"
+        )
+        stats = {
+            "matched": counts["matched"],
+            "different hash": counts["different_hash"],
+            "sig collision": counts["sig_collision"],
+            "wrong": counts["wrong"],
+            "missed": counts["missed"],
+            "ok": ok,
+            "total": total,
+            "unknown": counts["unknown"],
+            "reference": "native" if reference.is_native() else "ida",
+        }
+        if matched_dump.lib_funcs is not None:
+            stats["matched_lib_funcs"] = matched_dump.lib_funcs
+
+        # Only dumps exported by the current IDA scripts contain the function sizes
+        total_size = sum(reference.sizes) if reference.sizes is not None else 0
+        if total_size:
+            ok_size = sum(
+                size for size, category in zip(sizes, categories) if category in OK_CATEGORIES
+            )
+            lines.append(f"  Size-weighted: {ok_size} / {total_size} bytes")
+            stats |= {"ok size": ok_size, "total size": total_size}
+        return lines, stats, symbols
+    else:
+        try:
+            matched_dump = open_dump(f"{out_path}.{matched_extension}")
+        except FileNotFoundError:
+            return lines, None, []
+
+        total = len(matched_dump)
+        matched = sum(1 for name in matched_dump.names() if not name.startswith("sub_"))
+        matched_lib_funcs = matched_dump.lib_funcs
+
+        lines.append(f"  {matched} / {total} (no reference symbols)")
+        lines.append(f"  Functions marked as library functions: {matched_lib_funcs}")
+        return lines, {
+            "matched": matched,
+            "total": total,
+            "matched_lib_funcs": matched_lib_funcs,
+        }, []
@@ -0,0 +1,130 @@
+import sqlite3
+from collections import OrderedDict
+from importlib.metadata import version
+
+import rustc_demangle_py
+
+from shared import TARGET_PATH
+
+# Persistent memo of `rustc_demangle_py.demangle_batch()` results. The same std/core symbols show
+# up in pretty much every binary of the matrix so there's no need to demangle them again and again.
+# Lookups go through a small in-process LRU first, then the SQLite database under target/.
+
+DEMANGLE_CACHE_PATH = TARGET_PATH / "demangle_cache.sqlite"
+
+# Upper bound for the number of symbols kept on disk; least recently used ones get evicted first
+MAX_ENTRIES = 2_000_000
+LRU_SIZE = 200_000
+# Stay below SQLite's limit for host parameters in a single statement
+CHUNK_SIZE = 900
+
+
+class DemangleCache:
+    def __init__(self, path=DEMANGLE_CACHE_PATH, max_entries=MAX_ENTRIES, lru_size=LRU_SIZE):
+        self.max_entries = max_entries
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Multiple summary worker processes share the database
+        self.db = sqlite3.connect(path, timeout=600)
+        self.db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS demangled (
+                symbol TEXT PRIMARY KEY,
+                demangled TEXT,
+                no_hash TEXT,
+                msvc TEXT,
+                last_used INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS demangled_last_used ON demangled (last_used);
+            """
+        )
+        # Results may change with a different version of the demanglers
+        demangler_version = version("rustc_demangle_py")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != demangler_version:
+            self.db.execute("DELETE FROM demangled")
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (demangler_version,)
+            )
+            self.db.commit()
+
+    def remember(self, symbol, forms):
+        self.lru[symbol] = forms
+        self.lru.move_to_end(symbol)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    # Same interface as `rustc_demangle_py.demangle_batch()`
+    def demangle_batch(self, symbols):
+        results = {}
+        missing = []
+        for symbol in symbols:
+            if symbol in self.lru:
+                self.lru.move_to_end(symbol)
+                results[symbol] = self.lru[symbol]
+            else:
+                missing.append(symbol)
+
+        # Second level: SQLite (plain reads don't block the other workers)
+        not_cached = []
+        for i in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[i : i + CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.db.execute(
+                "SELECT symbol, demangled, no_hash, msvc FROM demangled "
+                f"WHERE symbol IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            for symbol, *forms in rows:
+                results[symbol] = tuple(forms)
+                self.remember(symbol, tuple(forms))
+            not_cached += [s for s in chunk if s not in results]
+
+        # Finally actually demangle whatever is left
+        demangled = rustc_demangle_py.demangle_batch(not_cached) if not_cached else []
+        for symbol, forms in zip(not_cached, demangled):
+            results[symbol] = tuple(forms)
+            self.remember(symbol, tuple(forms))
+
+        # Only take the write lock once everything is demangled so the workers don't serialize on it
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Logical clock which orders batches for the LRU eviction on disk
+            (now,) = self.db.execute(
+                "SELECT COALESCE(MAX(last_used), 0) + 1 FROM demangled"
+            ).fetchone()
+            for i in range(0, len(symbols), CHUNK_SIZE):
+                chunk = symbols[i : i + CHUNK_SIZE]
+                self.db.execute(
+                    "UPDATE demangled SET last_used = ? "
+                    f"WHERE symbol IN ({','.join('?' * len(chunk))})",
+                    [now] + chunk,
+                )
+            if not_cached:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO demangled VALUES (?, ?, ?, ?, ?)",
+                    [(s, *forms, now) for s, forms in zip(not_cached, demangled)],
+                )
+                self.evict()
+            self.db.commit()
+        except BaseException:
+            self.db.rollback()
+            raise
+
+        return [results[s] for s in symbols]
+
+    def evict(self):
+        (count,) = self.db.execute("SELECT COUNT(*) FROM demangled").fetchone()
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM demangled WHERE symbol IN "
+                "(SELECT symbol FROM demangled ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        self.db.close()
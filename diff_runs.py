@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from classify import classify_demangled
+from names import clean_name
+from registry import add_registry_arguments, registry_filters, select
+from shared import TARGET_PATH
+from symbol_dump import open_dump
+
+# Compares the classifications of two evaluation runs (e.g. before and after upgrading RustSigGen
+# or FLAIR) and reports which functions changed their category:
+#
+#   cp -r target/evaluation target/evaluation.old
+#   ... (rerun evaluate_std.py with the new version)
+#   uv run diff_runs.py std target/evaluation.old
+#
+# Per binary the (reference, matched) joins of both runs are merged on the address as streams and
+# classified in chunks so memory usage doesn't depend on the size of the binaries. Addresses which
+# only have a classification in one of the runs (e.g. the binary got rebuilt in between) show up
+# as transitions from/to `absent`.
+
+EVALUATION_PATH = TARGET_PATH / "evaluation"
+# Number of functions which get classified at once
+CHUNK_SIZE = 1 << 16
+ABSENT = "absent"
+
+
+def open_dumps(out_path, matched_extension):
+    return open_dump(f"{out_path}.reference"), open_dump(f"{out_path}.{matched_extension}")
+
+
+# Yields `(address, cleaned real name, cleaned matched name)` in address order
+def joined_names(reference, matched_dump):
+    for i, j in reference.join_indices(matched_dump):
+        real_name, matched_name = reference.name(i), matched_dump.name(j)
+        yield reference.addresses[i], clean_name(real_name), clean_name(matched_name)
+
+
+# Sorted-merge join of two address ordered streams; yields `(address, old pair, new pair)` where
+# the pairs are `(real name, matched name)` or `None` if the address is missing in that run
+def merge_runs(old, new):
+    old_item, new_item = next(old, None), next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield old_item[0], old_item[1:], None
+            old_item = next(old, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield new_item[0], None, new_item[1:]
+            new_item = next(new, None)
+        else:
+            yield old_item[0], old_item[1:], new_item[1:]
+            old_item, new_item = next(old, None), next(new, None)
+
+
+# Returns `(category, demangled real name, demangled matched name)` for every pair; missing pairs
+# are `absent` without names
+def classify_present(pairs):
+    present = [pair for pair in pairs if pair is not None]
+    results = iter(zip(*classify_demangled(*zip(*present)))) if present else iter(())
+    return [next(results) if pair is not None else (ABSENT, None, None) for pair in pairs]
+
+
+# Returns the category transitions of a single binary (Counter over `(old, new)` including
+# unchanged ones) and the changed functions as `(address, old category, new category, real name,
+# old matched name, new matched name)` with demangled names (only if `list_changed`); `None` if
+# either run has no results for it
+def diff_binary(old_path, new_path, matched_extension, list_changed=True):
+    try:
+        old_dumps = open_dumps(old_path, matched_extension)
+        new_dumps = open_dumps(new_path, matched_extension)
+    except FileNotFoundError:
+        return None
+    merged = merge_runs(joined_names(*old_dumps), joined_names(*new_dumps))
+
+    transitions = Counter()
+    changed = []
+    while chunk := list(islice(merged, CHUNK_SIZE)):
+        old_results = classify_present([old for _, old, _ in chunk])
+        new_results = classify_present([new for _, _, new in chunk])
+        for (addr, _, _), old_result, new_result in zip(chunk, old_results, new_results):
+            old_category, old_real, old_matched = old_result
+            new_category, new_real, new_matched = new_result
+            transitions[old_category, new_category] += 1
+            if list_changed and old_category != new_category:
+                changed.append(
+                    (
+                        addr,
+                        old_category,
+                        new_category,
+                        new_real or old_real,
+                        old_matched,
+                        new_matched,
+                    )
+                )
+    return transitions, changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "mode", choices=["std", "crates"], help="mode, either std or crates"
+    )
+    parser.add_argument("old", type=Path, help="evaluation directory of the old run")
+    parser.add_argument(
+        "new",
+        nargs="?",
+        type=Path,
+        default=EVALUATION_PATH,
+        help="evaluation directory of the new run (default: target/evaluation)",
+    )
+    parser.add_argument(
+        "--filter", help="optional regex to filter which binaries to consider"
+    )
+    parser.add_argument(
+        "--counts-only",
+        action="store_true",
+        help="only report the number of transitions instead of the functions involved",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of binaries to compare in parallel",
+    )
+    add_registry_arguments(parser)
+    args = parser.parse_args()
+
+    match args.mode:
+        case "std":
+            categories, exclude = None, ["uniqueness"]
+            matched_extension = "matched"
+        case "crates":
+            categories, exclude = ["oss_projects", "malware_samples"], None
+            matched_extension = "matched_with_crates"
+    binaries = select(categories, exclude, args.filter, **registry_filters(args))
+
+    jobs = []
+    for unstripped, stripped in binaries.items():
+        # No classifications without reference symbols
+        if unstripped == stripped:
+            continue
+        rel_path = Path(unstripped).relative_to(TARGET_PATH)
+        jobs.append((unstripped, args.old / rel_path, args.new / rel_path))
+
+    total = Counter()
+    with ProcessPoolExecutor(args.workers) as executor:
+        futures = [
+            (
+                unstripped,
+                executor.submit(
+                    diff_binary, old_path, new_path, matched_extension, not args.counts_only
+                ),
+            )
+            for unstripped, old_path, new_path in jobs
+        ]
+        # Report in submission order so the output stays deterministic
+        for unstripped, future in futures:
+            result = future.result()
+            if result is None:
+                print(f"{unstripped}\n  missing in one of the runs")
+                continue
+            transitions, changed = result
+            total += transitions
+            if all(old == new for old, new in transitions):
+                continue
+
+            print(unstripped)
+            for (old, new), count in sorted(transitions.items()):
+                if old != new:
+                    print(f"  {old} -> {new}: {count}")
+            for addr, old, new, real_name, old_matched, new_matched in changed:
+                print(
+                    f"    {addr:#x} {real_name}: "
+                    f"{old_matched} ({old}) -> {new_matched} ({new})"
+                )
+
+    print("Total:")
+    unchanged = sum(count for (old, new), count in total.items() if old == new)
+    print(f"  unchanged: {unchanged}")
+    for (old, new), count in sorted(total.items()):
+        if old != new:
+            print(f"  {old} -> {new}: {count}")
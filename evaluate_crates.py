@@ -1,21 +1,35 @@
 #!/usr/bin/env python3
 
-from collections import ChainMap
+import argparse
 from pathlib import Path
-import subprocess
+import os
+import shutil
 import json
+import sys
+import tempfile
 
-from shared import TARGET_PATH, FLAIR_PATH
-
-# NOTE: This assumes IDA Pro 9.0 (so the binary is just called `ida`)
-
-# TODO: Would be cool to leverage the new idalib for this. But need to make plugin work optionally
-#       without QT event loop.
+import metrics
+from artifact_store import dedupe, fan_out
+from ida_runner import (
+    IdaJob,
+    add_ida_arguments,
+    report_failures,
+    run_ida_jobs,
+    snapshot_job,
+)
+from registry import add_registry_arguments, artifact_hashes, registry_filters, select
+from shared import (
+    TARGET_PATH,
+    FLAIR_PATH,
+    hash_file,
+    sig_stamp,
+)
+from symbol_dump import open_dump
 
 EVALUATION_PATH = TARGET_PATH / "evaluation"
 SIGNATURES_PATH = TARGET_PATH / "crate_sigs"
-
-IDA_SCRIPT_PATH = Path(__file__).parent / "ida_scripts" / "get_symbols.py"
+# Generated signatures are stored once by content and hardlinked into `SIGNATURES_PATH`
+SIGNATURES_STORE_PATH = TARGET_PATH / "crate_sigs_store"
 
 # `--profile release` is default
 FLAGS = {
@@ -35,72 +49,148 @@ FLAGS = {
     "target/1.82.0/x86_64-unknown-linux-gnu/release/resvg": "",
 }
 
-with open(TARGET_PATH / "binaries.json") as f:
-    binaries = json.loads(f.read())
-    binaries = ChainMap(
-        *[
-            binaries[k]
-            for k in binaries.keys()
-            if k in ["oss_projects", "malware_samples"]
-        ]
-    )
+
+# Returns whether the signatures differ from the ones used last time
+def generate_crate_sigs(stripped, flags, sig_path):
+    key = sig_stamp(stripped, flags)
+    manifest_path = SIGNATURES_STORE_PATH / "manifests" / f"{key}.json"
+    key_path = sig_path.parent / f"{sig_path.name}.key"
+    blobs_path = SIGNATURES_STORE_PATH / "blobs"
+
+    if not manifest_path.exists():
+        with tempfile.TemporaryDirectory(prefix="crate_sigs_") as tmp_dir:
+            out_dir = Path(tmp_dir) / "sigs"
+            metrics.check_output(
+                [
+                    "rust-sig-gen",
+                    "-f",
+                    str(FLAIR_PATH),
+                    "-o",
+                    str(out_dir),
+                    "crates",
+                    stripped,
+                ]
+                + flags.split(),
+                "rust-sig-gen crates",
+                stripped,
+            )
+
+            # Per-crate outputs which are identical between binaries only get stored once
+            blobs_path.mkdir(parents=True, exist_ok=True)
+            manifest = {}
+            for path in sorted(out_dir.rglob("*")):
+                if not path.is_file():
+                    continue
+                digest = hash_file(path)
+                if not (blobs_path / digest).exists():
+                    shutil.move(path, blobs_path / digest)
+                manifest[str(path.relative_to(out_dir))] = digest
+
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_path, "w") as f:
+            f.write(json.dumps(manifest))
+
+    with open(manifest_path) as f:
+        manifest = json.loads(f.read())
+
+    if key_path.exists() and key_path.read_text() == key and sig_path.exists():
+        return False
+
+    shutil.rmtree(sig_path, ignore_errors=True)
+    sig_path.mkdir(parents=True)
+    for name, digest in manifest.items():
+        (sig_path / name).parent.mkdir(parents=True, exist_ok=True)
+        os.link(blobs_path / digest, sig_path / name)
+    key_path.write_text(key)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_ida_arguments(parser)
+    add_registry_arguments(parser)
+    args = parser.parse_args()
+    if args.snapshot and args.backend != "idalib":
+        parser.error("--snapshot requires the idalib backend")
+
+    binaries = select(["oss_projects", "malware_samples"], **registry_filters(args))
     for b in binaries:
         assert b in FLAGS, f"missing flags for {b}"
+    # Binaries with identical content (and flags) only get evaluated once
+    aliases = dedupe(binaries, artifact_hashes(), lambda unstripped: FLAGS[unstripped])
 
-for unstripped, stripped in binaries.items():
-    if FLAGS[unstripped] == "TODO":
-        continue
+    snapshot_jobs = []
+    jobs = []
+    for unstripped in aliases:
+        stripped = binaries[unstripped]
+        if FLAGS[unstripped] == "TODO":
+            continue
 
-    print(unstripped)
-    is_msvc = True if stripped.endswith(".pdb") else False
+        print(unstripped)
+        is_msvc = True if stripped.endswith(".pdb") else False
 
-    rel_path = Path(unstripped).relative_to(TARGET_PATH)
-    out_path = EVALUATION_PATH / rel_path
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+        rel_path = Path(unstripped).relative_to(TARGET_PATH)
+        out_path = EVALUATION_PATH / rel_path
 
-    out_path_ref = out_path.absolute().with_suffix(out_path.suffix + ".reference")
-    out_path_matched = out_path.absolute().with_suffix(
-        out_path.suffix + ".matched_with_crates"
-    )
+        out_path_ref = out_path.absolute().with_suffix(out_path.suffix + ".reference")
+        out_path_matched = out_path.absolute().with_suffix(
+            out_path.suffix + ".matched_with_crates"
+        )
+        # Shared with evaluate_std.py
+        out_path_snapshot = out_path.absolute().with_suffix(out_path.suffix + ".i64")
+        native_reference = out_path_ref.exists() and open_dump(out_path_ref).is_native()
+        # Snapshot jobs also write the reference which would replace the native one
+        use_snapshot = args.snapshot and unstripped != stripped and not native_reference
 
-    if unstripped != stripped:
-        # Ground truth symbols; for MSVC this will autoload the .pdb
-        if not out_path_ref.exists():
-            subprocess.check_output(
-                [
-                    "ida",
-                    "-c",  # Ignore old db
-                    "-A",  # No dialog boxes
-                    f"-S{IDA_SCRIPT_PATH} {out_path_ref} nomatch",
-                    unstripped,
-                ]
+        if unstripped != stripped:
+            # Ground truth symbols; for MSVC this will autoload the .pdb
+            if native_reference:
+                print("  using existing native reference (see native_symbols.py)")
+            elif use_snapshot and not out_path_snapshot.exists():
+                snapshot_jobs.append(
+                    snapshot_job(unstripped, stripped, out_path_ref, out_path_snapshot)
+                )
+            elif not out_path_ref.exists():
+                jobs.append(
+                    IdaJob(
+                        unstripped,
+                        out_path_ref,
+                        ["nomatch"],
+                        extra_files=[stripped] if is_msvc else [],
+                    )
+                )
+
+        # Generate crate signatures (or reuse them if nothing changed)
+        sig_path = (SIGNATURES_PATH / rel_path).absolute()
+        if generate_crate_sigs(stripped, FLAGS[unstripped], sig_path):
+            # Matching results with the previous signatures are stale now
+            out_path_matched.unlink(missing_ok=True)
+
+        # Symbols detected using signatures
+        if not out_path_matched.exists():
+            source = unstripped if is_msvc else stripped
+            jobs.append(
+                IdaJob(
+                    out_path_snapshot if use_snapshot else source,
+                    out_path_matched,
+                    ["match", str(sig_path)],
+                    # Disable .pdb loading so we have no symbols a priori
+                    ida_args=[] if use_snapshot else ["-Opdb:off"],
+                    source=source,
+                )
             )
 
-    # Generate crate signatures
-    sig_path = (SIGNATURES_PATH / rel_path).absolute()
-    if not sig_path.exists():
-        subprocess.check_output(
-            [
-                "rust-sig-gen",
-                "-f",
-                str(FLAIR_PATH),
-                "-o",
-                str(sig_path),
-                "crates",
-                stripped,
-            ]
-            + FLAGS[unstripped].split(),
-        )
+    failures = run_ida_jobs(snapshot_jobs, args)
+    # Matching jobs whose snapshot failed are already accounted for
+    failures += run_ida_jobs([job for job in jobs if job.binary.exists()], args)
 
-    # Symbols detected using signatures
-    if not out_path_matched.exists():
-        subprocess.check_output(
-            [
-                "ida",
-                "-c",
-                "-A",
-                "-Opdb:off",  # Disable .pdb loading so we have no symbols a priori
-                f"-S{IDA_SCRIPT_PATH} {out_path_matched} match {sig_path}",
-                unstripped if is_msvc else stripped,
-            ],
+    for unstripped, others in aliases.items():
+        fan_out(
+            EVALUATION_PATH / Path(unstripped).relative_to(TARGET_PATH),
+            [EVALUATION_PATH / Path(other).relative_to(TARGET_PATH) for other in others],
+            [".reference", ".matched_with_crates", ".i64"],
         )
+
+    report_failures(failures)
+    if failures:
+        sys.exit(1)
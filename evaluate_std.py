@@ -1,58 +1,97 @@
 #!/usr/bin/env python3
 
-import json
-import subprocess
-from collections import ChainMap
+import argparse
+import sys
 from pathlib import Path
 
+from artifact_store import dedupe, fan_out
+from ida_runner import (
+    IdaJob,
+    add_ida_arguments,
+    report_failures,
+    run_ida_jobs,
+    snapshot_job,
+)
+from registry import add_registry_arguments, artifact_hashes, registry_filters, select
 from shared import TARGET_PATH
-
-# NOTE: This assumes IDA Pro 9.0 (so the binary is just called `ida`)
-
-# TODO: Would be cool to leverage the new idalib for this. But need to make plugin work optionally
-#       without QT event loop.
+from symbol_dump import open_dump
 
 EVALUATION_PATH = TARGET_PATH / "evaluation"
 
-IDA_SCRIPT_PATH = Path(__file__).parent / "ida_scripts" / "get_symbols.py"
+parser = argparse.ArgumentParser()
+add_ida_arguments(parser)
+add_registry_arguments(parser)
+args = parser.parse_args()
+if args.snapshot and args.backend != "idalib":
+    parser.error("--snapshot requires the idalib backend")
 
-with open(TARGET_PATH / "binaries.json") as f:
-    binaries = json.loads(f.read())
-    binaries = ChainMap(*[binaries[k] for k in binaries.keys() if k != "uniqueness"])
+binaries = select(exclude=["uniqueness"], **registry_filters(args))
+# Binaries with identical content only get evaluated once
+aliases = dedupe(binaries, artifact_hashes())
 
-for unstripped, stripped in binaries.items():
-    print(unstripped)
+snapshot_jobs = []
+jobs = []
+native_references = 0
+for unstripped in aliases:
+    stripped = binaries[unstripped]
     is_msvc = True if stripped.endswith(".pdb") else False
 
     rel_path = Path(unstripped).relative_to(TARGET_PATH)
     out_path = EVALUATION_PATH / rel_path
-    out_path.parent.mkdir(parents=True, exist_ok=True)
 
     out_path_ref = out_path.absolute().with_suffix(out_path.suffix + ".reference")
     out_path_matched = out_path.absolute().with_suffix(out_path.suffix + ".matched")
+    out_path_snapshot = out_path.absolute().with_suffix(out_path.suffix + ".i64")
+    native_reference = out_path_ref.exists() and open_dump(out_path_ref).is_native()
+    # Snapshot jobs also write the reference which would replace the native one
+    use_snapshot = args.snapshot and unstripped != stripped and not native_reference
 
     if unstripped != stripped:
         # Ground truth symbols; for MSVC this will autoload the .pdb
-        if not out_path_ref.exists():
-            subprocess.check_output(
-                [
-                    "ida",
-                    "-c",  # Ignore old db
-                    "-A",  # No dialog boxes
-                    f"-S{IDA_SCRIPT_PATH} {out_path_ref} nomatch",
+        if native_reference:
+            native_references += 1
+        elif use_snapshot and not out_path_snapshot.exists():
+            snapshot_jobs.append(
+                snapshot_job(unstripped, stripped, out_path_ref, out_path_snapshot)
+            )
+        elif not out_path_ref.exists():
+            jobs.append(
+                IdaJob(
                     unstripped,
-                ]
+                    out_path_ref,
+                    ["nomatch"],
+                    extra_files=[stripped] if is_msvc else [],
+                )
             )
 
     # Symbols detected using signatures
     if not out_path_matched.exists():
-        subprocess.check_output(
-            [
-                "ida",
-                "-c",
-                "-A",
-                "-Opdb:off",  # Disable .pdb loading so we have no symbols a priori
-                f"-S{IDA_SCRIPT_PATH} {out_path_matched} match",
-                unstripped if is_msvc else stripped,
-            ],
+        source = unstripped if is_msvc else stripped
+        jobs.append(
+            IdaJob(
+                out_path_snapshot if use_snapshot else source,
+                out_path_matched,
+                ["match"],
+                # Disable .pdb loading so we have no symbols a priori
+                ida_args=[] if use_snapshot else ["-Opdb:off"],
+                source=source,
+            )
         )
+
+if native_references:
+    print(f"Using {native_references} existing native references (see native_symbols.py)")
+
+failures = run_ida_jobs(snapshot_jobs, args)
+# Matching jobs whose snapshot failed are already accounted for
+failures += run_ida_jobs([job for job in jobs if job.binary.exists()], args)
+
+for unstripped, others in aliases.items():
+    fan_out(
+        EVALUATION_PATH / Path(unstripped).relative_to(TARGET_PATH),
+        [EVALUATION_PATH / Path(other).relative_to(TARGET_PATH) for other in others],
+        [".reference", ".matched", ".i64"],
+    )
+
+report_failures(failures)
+if failures:
+    sys.exit(1)
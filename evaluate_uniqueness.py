@@ -1,99 +1,176 @@
 #!/usr/bin/env python3
 
+import argparse
 import json
 import os
-import subprocess
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import idapro
-import ida_auto
-import ida_funcs
-import ida_segment
-import ida_undo
-import idautils
-
-from shared import FLAIR_PATH, TARGET_PATH, THESIS_DATA_PATH
+import metrics
+from registry import select
+from shared import (
+    FLAIR_PATH,
+    TARGET_PATH,
+    THESIS_DATA_PATH,
+    sig_stamp,
+)
 
 # NOTE: `rust-sig-gen` needs to be available in $PATH
 
 EVALUATION_PATH = TARGET_PATH / "evaluation"
 SIGNATURES_OUT_PATH = TARGET_PATH / "uniqueness_sigs"
 
+SIGNATURES_STAMPS_PATH = SIGNATURES_OUT_PATH / "stamps.json"
 
-# Adapted from idalib's idacli.py example
-def apply_sig_file(sig_file_name):
-    ida_funcs.plan_to_apply_idasgn(sig_file_name)
-    ida_auto.auto_wait()
-
-    match_count = 0
-    for index in range(0, ida_funcs.get_idasgn_qty()):
-        fname, _, fmatches = ida_funcs.get_idasgn_desc_with_matches(index)
-        if fname in sig_file_name:
-            match_count = fmatches
-            break
-
-    return match_count
-
-
-with open(TARGET_PATH / "binaries.json") as f:
-    binaries = json.loads(f.read())
-    binaries = binaries["uniqueness"]
+WORKER_PATH = Path(__file__).parent / "uniqueness_worker.py"
 
-if len(list(SIGNATURES_OUT_PATH.glob("*.sig"))) < len(binaries):
-    for unstripped, stripped in binaries.items():
-        print(unstripped, stripped)
 
-        subprocess.check_output(
+def generate_std_sig(stripped):
+    # Every generation gets its own output directory so concurrent runs can't interfere
+    with tempfile.TemporaryDirectory(prefix="std_sig_") as out_dir:
+        metrics.check_output(
             [
                 "rust-sig-gen",
                 "-f",
                 str(FLAIR_PATH),
                 "-o",
-                str(SIGNATURES_OUT_PATH),
+                out_dir,
                 "std",
                 stripped,
             ],
+            "rust-sig-gen std",
+            stripped,
         )
-sigs = sorted(list(SIGNATURES_OUT_PATH.glob("*.sig")))
-bins_stripped = sorted(binaries.values())
+        SIGNATURES_OUT_PATH.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in Path(out_dir).iterdir():
+            shutil.move(path, SIGNATURES_OUT_PATH / path.name)
+            files.append(path.name)
+        return files
+
+
+# Every row runs in its own idalib process on its own copy of the binary (IDA puts the database
+# next to it)
+def evaluate_row(binary, sigs, attribution):
+    with tempfile.TemporaryDirectory(prefix="uniqueness_") as work_dir:
+        work_dir = Path(work_dir)
+        binary_copy = work_dir / Path(binary).name
+        shutil.copy(binary, binary_copy)
+        out_path = work_dir / "row.json"
+        metrics.check_output(
+            [sys.executable, WORKER_PATH, binary_copy, out_path, attribution]
+            + [str(sig.absolute()) for sig in sigs],
+            "uniqueness row",
+            binary,
+            detail=attribution,
+        )
+        with open(out_path) as f:
+            return json.loads(f.read())
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-j",
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="number of matrix rows (idalib processes) to evaluate in parallel",
+)
+parser.add_argument(
+    "--sig-jobs",
+    type=int,
+    default=4,
+    help="number of std signatures to generate in parallel",
+)
+parser.add_argument(
+    "--attribution",
+    choices=["undo", "snapshot"],
+    default="undo",
+    help="how to reset the database between signatures (see uniqueness_worker.py)",
+)
+args = parser.parse_args()
+
+binaries = select(["uniqueness"])
+
+# Signatures are tracked per version so only missing or stale ones get regenerated
+try:
+    with open(SIGNATURES_STAMPS_PATH) as f:
+        stamps = json.loads(f.read())
+except FileNotFoundError:
+    stamps = {}
+
+
+def write_stamps():
+    SIGNATURES_OUT_PATH.mkdir(parents=True, exist_ok=True)
+    with open(SIGNATURES_STAMPS_PATH, "w") as f:
+        f.write(json.dumps(stamps))
+
+
+# Removes signature files of older generations which aren't listed by any stamp anymore
+def remove_stale_sigs(names):
+    listed = {name for generated in stamps.values() for name in generated["files"]}
+    for name in set(names) - listed:
+        (SIGNATURES_OUT_PATH / name).unlink(missing_ok=True)
+
+
+# Versions which are no longer part of the matrix
+selected_versions = {Path(stripped).parts[1] for stripped in binaries.values()}
+for version in set(stamps) - selected_versions:
+    removed = stamps.pop(version)
+    remove_stale_sigs(removed["files"])
+    write_stamps()
+
+missing = {}
+for unstripped, stripped in binaries.items():
+    version = Path(stripped).parts[1]
+    stamp = sig_stamp(stripped)
+    generated = stamps.get(version, {})
+    if generated.get("stamp") != stamp or not all(
+        (SIGNATURES_OUT_PATH / name).exists() for name in generated["files"]
+    ):
+        missing[version] = (stripped, stamp)
+
+if missing:
+    print(f"Generating std signatures for {len(missing)} versions...")
+    with ThreadPoolExecutor(args.sig_jobs) as executor:
+        futures = {
+            version: executor.submit(generate_std_sig, stripped)
+            for version, (stripped, _) in missing.items()
+        }
+        for version, future in futures.items():
+            files = future.result()
+            print(version)
+            old_files = stamps.get(version, {}).get("files", [])
+            stamps[version] = {"stamp": missing[version][1], "files": files}
+            remove_stale_sigs(old_files)
+            # Persist after every version so an interrupted run doesn't lose finished work
+            write_stamps()
 
-versions = []
-for i in range(len(bins_stripped)):
-    bin_ver = Path(bins_stripped[i]).parts[1]
-    sig_ver = (
-        sigs[i].name.removeprefix("rust-std-").removesuffix(".sig").replace("-", ".")
+bins_stripped = sorted(binaries.values())
+versions = [Path(stripped).parts[1] for stripped in bins_stripped]
+# One signature per version in the same order as the rows; taken from the stamps so leftovers in
+# the output directory can't shift the columns
+sigs = []
+for version in versions:
+    (sig,) = [name for name in stamps[version]["files"] if name.endswith(".sig")]
+    sigs.append(SIGNATURES_OUT_PATH / sig)
+
+with ThreadPoolExecutor(args.workers) as executor:
+    results = list(
+        executor.map(
+            lambda binary: evaluate_row(binary, sigs, args.attribution), bins_stripped
+        )
     )
-    assert bin_ver == sig_ver
-    versions.append(bin_ver)
 
 matrix = []
 total_functions = []
-for binary in bins_stripped:
-    print(binary)
-    row = []
-
-    # Open database and wait for auto-analysis
-    idapro.open_database(binary, True)
-
-    # Get total number of functions
-    total = 0
-    for ea in idautils.Functions():
-        # Ignore imports; only works properly for Linux which suffices here
-        if ida_segment.get_segm_name(ida_segment.getseg(ea)) == "extern":
-            continue
-        total += 1
-    total_functions.append(total)
-
-    for sig in sigs:
-        assert ida_undo.create_undo_point(b"pre_sig")
-        match_count = apply_sig_file(str(sig.absolute()))
-        row.append(match_count)
-        print(sig, match_count)
-        assert ida_undo.perform_undo()
-    matrix.append(row)
-
-    # Close database without saving
-    idapro.close_database(False)
+for binary, result in zip(bins_stripped, results):
+    print(binary, result["row"])
+    total_functions.append(result["total_functions"])
+    matrix.append(result["row"])
 
 os.makedirs(THESIS_DATA_PATH, exist_ok=True)
 with open(THESIS_DATA_PATH / "uniqueness.json", "w") as f:
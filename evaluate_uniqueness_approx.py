@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from shared import TARGET_PATH, THESIS_DATA_PATH
+
+# Fast, IDA-free approximation of evaluate_uniqueness.py. Instead of applying every signature to
+# every binary we directly compare the FLIRT patterns `rust-sig-gen std` generated (the `.pat` files
+# next to the `.sig` files) and compute pairwise overlap/Jaccard matrices over them. This is useful
+# for quickly screening large version sweeps; evaluate_uniqueness.py stays the exact measurement.
+
+SIGNATURES_OUT_PATH = TARGET_PATH / "uniqueness_sigs"
+
+
+# Hash of a single pattern line ignoring all (public and referenced) names since those contain the
+# version specific symbol hashes. What's left (leading bytes, CRC, function length and tail bytes)
+# is what FLIRT actually matches on.
+def hash_pattern(line):
+    tokens = line.split()
+    kept = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i].startswith((":", "^")):
+            # `:offset name` / `^offset name`
+            i += 2
+            continue
+        kept.append(tokens[i])
+        i += 1
+    digest = hashlib.blake2b(" ".join(kept).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def load_patterns(path):
+    patterns = set()
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line == "---":
+                continue
+            patterns.add(hash_pattern(line))
+    return patterns
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--path",
+    type=Path,
+    default=SIGNATURES_OUT_PATH,
+    help="directory containing the `.pat` files",
+)
+args = parser.parse_args()
+
+pats = sorted(args.path.glob("*.pat"))
+assert pats, f"no .pat files found in {args.path}"
+
+versions = []
+patterns = []
+for pat in pats:
+    versions.append(
+        pat.name.removeprefix("rust-std-").removesuffix(".pat").replace("-", ".")
+    )
+    patterns.append(load_patterns(pat))
+    print(versions[-1], len(patterns[-1]))
+
+overlap = []
+jaccard = []
+for a in patterns:
+    overlap_row = []
+    jaccard_row = []
+    for b in patterns:
+        intersection = len(a & b)
+        union = len(a) + len(b) - intersection
+        overlap_row.append(intersection)
+        jaccard_row.append(intersection / union if union else 1.0)
+    overlap.append(overlap_row)
+    jaccard.append(jaccard_row)
+
+os.makedirs(THESIS_DATA_PATH, exist_ok=True)
+with open(THESIS_DATA_PATH / "uniqueness_approx.json", "w") as f:
+    f.write(
+        json.dumps(
+            {
+                "versions": versions,
+                "total_patterns": [len(p) for p in patterns],
+                "overlap": overlap,
+                "jaccard": jaccard,
+            }
+        )
+    )
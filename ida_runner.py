@@ -0,0 +1,296 @@
+import os
+import queue
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+from pathlib import Path
+
+import metrics
+
+# NOTE: This assumes IDA Pro 9.0 (so the binary is just called `ida`)
+
+IDA_SCRIPT_PATH = Path(__file__).parent / "ida_scripts" / "get_symbols.py"
+IDA_SERVER_PATH = Path(__file__).parent / "ida_server.py"
+
+
+class IdaJob:
+    def __init__(
+        self, binary, out_path, script_args, ida_args=(), extra_files=(), source=None
+    ):
+        # Either an executable or a database snapshot (`.i64`)
+        self.binary = Path(binary)
+        self.out_path = Path(out_path)
+        self.script_args = list(script_args)
+        self.ida_args = list(ida_args)
+        # Files which IDA expects next to the binary (e.g. the `.pdb` for MSVC binaries)
+        self.extra_files = [Path(p) for p in extra_files]
+        # Executable the std signatures get generated for (differs if `binary` is a snapshot)
+        self.source = Path(source) if source else self.binary
+
+    def __str__(self):
+        return f"{self.binary} -> {self.out_path.name}"
+
+
+def link_inputs(job, work_dir):
+    # IDA puts its database files next to the input so every job gets its own working directory
+    # with symlinks to the inputs. Otherwise concurrent jobs on the same binary (e.g. MSVC where
+    # the reference and matched pass use the same file) would clobber each other's database.
+    binary = work_dir / job.binary.name
+    if binary.suffix == ".i64":
+        # IDA unpacks the snapshot next to it so better not touch the original
+        shutil.copy(job.binary, binary)
+    else:
+        binary.symlink_to(job.binary.absolute())
+    for extra in job.extra_files:
+        (work_dir / extra.name).symlink_to(extra.absolute())
+    return binary
+
+
+def run_ida(job, work_dir, timeout):
+    binary = link_inputs(job, work_dir)
+
+    # The script writes into the working directory first and we only move the output into place
+    # once IDA exited successfully; a killed run must not leave behind a partial output which
+    # would make us skip the binary next time.
+    tmp_out = work_dir / job.out_path.name
+    script = " ".join([str(IDA_SCRIPT_PATH), str(tmp_out)] + job.script_args)
+    process = metrics.Popen(
+        [
+            "ida",
+            "-c",  # Ignore old db
+            "-A",  # No dialog boxes
+            f"-L{work_dir / 'ida.log'}",
+            *job.ida_args,
+            f"-S{script}",
+            binary,
+        ],
+        f"ida {job.script_args[0]}",
+        job.source,
+        detail=job.out_path.name,
+        cwd=work_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # Own process group so we can also kill anything IDA spawned (e.g. `rust-sig-gen`)
+        start_new_session=True,
+    )
+    try:
+        returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        raise RuntimeError(f"timed out after {timeout}s")
+
+    if returncode != 0:
+        raise RuntimeError(f"ida exited with {returncode}")
+    if not tmp_out.exists():
+        raise RuntimeError("ida exited without writing any output")
+    job.out_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(tmp_out, job.out_path)
+
+
+# Persistent idalib based IDA instance (see ida_server.py)
+class IdalibServer:
+    def __init__(self):
+        self.socket_dir = tempfile.TemporaryDirectory(prefix="ida_server_")
+        address = str(Path(self.socket_dir.name) / "socket")
+        authkey = secrets.token_hex(16).encode()
+        # Records the server's peak RSS over all binaries it opened once it exits
+        self.process = metrics.Popen(
+            [sys.executable, IDA_SERVER_PATH, address],
+            "idalib server",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.process.stdin.write(authkey + b"\n")
+        self.process.stdin.close()
+        if self.process.stdout.readline().strip() != b"ready":
+            self.kill()
+            raise RuntimeError("idalib server failed to start")
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+
+    # Records the op's metrics if it's part of a `job`
+    def request(self, deadline, op, job=None, **kwargs):
+        self.conn.send(dict(kwargs, op=op))
+        if not self.conn.poll(max(deadline - time.monotonic(), 0)):
+            raise TimeoutError
+        response = self.conn.recv()
+        if job:
+            usage = response["usage"]
+            metrics.record(
+                f"idalib {op}",
+                job.source,
+                usage["wall"],
+                usage["cpu"],
+                # Only known for the whole server (see above)
+                None,
+                job.out_path.name,
+            )
+        if not response["ok"]:
+            raise RuntimeError(f"{op} failed:\n{response['error']}")
+        return response["result"]
+
+    def shutdown(self):
+        self.conn.send({"op": "shutdown"})
+        self.process.wait()
+        self.socket_dir.cleanup()
+
+    def kill(self):
+        os.killpg(self.process.pid, signal.SIGKILL)
+        self.process.wait()
+        self.socket_dir.cleanup()
+
+
+class IdalibRunner:
+    def __init__(self):
+        # Idle servers; each worker thread checks one out per job
+        self.servers = queue.SimpleQueue()
+
+    def __call__(self, job, work_dir, timeout):
+        try:
+            server = self.servers.get_nowait()
+        except queue.Empty:
+            server = IdalibServer()
+
+        binary = link_inputs(job, work_dir)
+        deadline = time.monotonic() + timeout
+        try:
+            server.request(deadline, "open", job, binary=str(binary), args=" ".join(job.ida_args))
+            server.request(deadline, "analyze", job)
+            if job.script_args[0] == "match":
+                sigs = []
+                if len(job.script_args) > 1:
+                    sigs = [str(p) for p in sorted(Path(job.script_args[1]).glob("*.sig"))]
+                std = str(job.source.absolute())
+                server.request(deadline, "match", job, std=std, sigs=sigs)
+            # Written into the working directory first like with the `ida` backend
+            tmp_out = work_dir / job.out_path.name
+            server.request(deadline, "extract", job, path=str(tmp_out))
+            if job.script_args[0] == "snapshot":
+                # Save the analyzed database without any names so the matching passes can start
+                # from it instead of analyzing the binary again
+                snapshot = Path(job.script_args[1])
+                tmp_snapshot = work_dir / snapshot.name
+                server.request(deadline, "strip_names", job)
+                server.request(deadline, "save", job, path=str(tmp_snapshot))
+            server.request(deadline, "close", job)
+        except TimeoutError:
+            server.kill()
+            raise RuntimeError(f"timed out after {timeout}s")
+        except (RuntimeError, EOFError, OSError) as e:
+            # Don't reuse a server which is in an unknown state
+            server.kill()
+            raise RuntimeError(str(e))
+        self.servers.put(server)
+
+        job.out_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(tmp_out, job.out_path)
+        if job.script_args[0] == "snapshot":
+            shutil.move(tmp_snapshot, snapshot)
+
+    def shutdown(self):
+        while not self.servers.empty():
+            self.servers.get_nowait().shutdown()
+
+
+def run_job(job, runner, timeout, retries):
+    for attempt in range(retries + 1):
+        with tempfile.TemporaryDirectory(prefix="ida_job_") as work_dir:
+            work_dir = Path(work_dir)
+            try:
+                runner(job, work_dir, timeout)
+                return None
+            except RuntimeError as e:
+                error = e
+                print(f"{job}: attempt {attempt + 1}/{retries + 1} failed: {e}")
+                # Keep IDA's log of the last failed attempt around for debugging
+                log = work_dir / "ida.log"
+                if log.exists():
+                    job.out_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy(log, job.out_path.with_suffix(job.out_path.suffix + ".log"))
+    return error
+
+
+# Runs all jobs on a bounded pool of concurrent IDA instances. Returns the failed jobs together
+# with the error of their last attempt.
+def run_ida_jobs(jobs, args):
+    runner = IdalibRunner() if args.backend == "idalib" else run_ida
+    failures = []
+    with ThreadPoolExecutor(args.workers) as executor:
+        futures = [
+            (job, executor.submit(run_job, job, runner, args.timeout, args.retries))
+            for job in jobs
+        ]
+        for job, future in futures:
+            error = future.result()
+            if error:
+                failures.append((job, error))
+            else:
+                print(job)
+    if args.backend == "idalib":
+        runner.shutdown()
+    return failures
+
+
+def report_failures(failures):
+    if failures:
+        print(f"{len(failures)} IDA job(s) failed:")
+        for job, error in failures:
+            print(f"  {job}: {error}")
+
+
+# Snapshot mode: Analyze every binary only once (with symbols), extract the reference symbols and
+# save the database minus all names. The std and crate matching passes then start from a copy of
+# that snapshot instead of running their own auto-analysis.
+# NOTE: This isn't exactly equivalent to analyzing the stripped binary since IDA may have used the
+#       symbols e.g. to find function boundaries. Only supported by the idalib backend.
+def snapshot_job(unstripped, stripped, out_path_ref, snapshot_path):
+    is_msvc = stripped.endswith(".pdb")
+    return IdaJob(
+        unstripped,
+        out_path_ref,
+        ["snapshot", str(snapshot_path)],
+        # For MSVC this will autoload the .pdb
+        extra_files=[stripped] if is_msvc else [],
+    )
+
+
+def add_ida_arguments(parser):
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="reuse one auto-analysis per binary for the reference and all matching passes",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["ida", "idalib"],
+        # The idalib servers generate the std signatures with the `rust-sig-gen` CLI instead of
+        # the plugin so stick to the plugin until both are shown to give the same results
+        default="ida",
+        help="launch a fresh `ida` for every job or submit jobs to persistent idalib servers",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of IDA instances to run concurrently",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=3600,
+        help="wall-clock timeout in seconds after which an IDA instance gets killed",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="how often to retry a failed or timed out IDA job",
+    )
@@ -1,5 +1,3 @@
-import json
-import sys
 from pathlib import Path
 
 import ida_auto
@@ -7,70 +5,46 @@ import ida_funcs
 import ida_idp
 import ida_kernwin
 import ida_loader
-import ida_segment
-import idautils
 import idc
 
-# ida -c -A -S"$(pwd)/get_symbols.py $(pwd)/out.txt match" /path/to/bin
+# IDAPython adds the script's directory to `sys.path`
+from symbols import export_functions, iter_functions
+
+# ida -c -A -S"$(pwd)/get_symbols.py $(pwd)/out.dump match" /path/to/bin
+#
+# Writes all functions as a symbol dump (see symbol_dump.py)
 
 # NOTE: Can't use `idat` since our plugin depends on the Qt event loop
 # NOTE: Disable Lumina in IDA's settings so we don't depend on external (non-deterministic) data
 
 if len(idc.ARGV) > 1:
     # Batch mode
-    f = open(idc.ARGV[1], "w")
+    out_path = idc.ARGV[1]
     do_matching = idc.ARGV[2] == "match"
     additional_sigs = idc.ARGV[3] if 3 < len(idc.ARGV) else None
 else:
     # Interactive mode
-    f = sys.stdout
+    out_path = None
     do_matching = True
     additional_sigs = None
 
 
-def log(msg):
-    return f.write(msg + "\n")
+def export():
+    if out_path:
+        export_functions(out_path)
+    else:
+        for ea, size, name, flags in iter_functions():
+            print(f"{ea:#x} {size:#x} {flags} {name}")
 
 
 # Exit IDA Pro if running in batch mode. Otherwise assume running interactively and don't quit.
 def exit_if_batchmode():
-    if f != sys.stdout:
+    if out_path:
         # Don't save `.i64` database file after quitting
         ida_loader.set_database_flag(ida_loader.DBFL_TEMP)
-        f.close()
         idc.qexit(0)
 
 
-def get_all_functions():
-    ret = {}
-    for ea in idautils.Functions():
-        # Assert that Lumina hasn't affected our results
-        assert ida_funcs.get_func(ea).flags & ida_funcs.FUNC_LUMINA == 0
-
-        # Ignore imports (Linux)
-        if ida_segment.get_segm_name(ida_segment.getseg(ea)) == "extern":
-            continue
-        # For MSVC binaries this doesn't work since they thunk functions are just in the default
-        # .text segment. IDA does know that they're external symbols (since they're colored) but
-        # I don't know how to access that flag... Their addresses are stable though so they don't
-        # mess up our evaluation too much.
-
-        ret[ea] = ida_funcs.get_func_name(ea)
-    return ret
-
-
-def get_number_of_lib_functions():
-    n = 0
-    for ea in idautils.Functions():
-        # Ignore imports (Linux)
-        if ida_segment.get_segm_name(ida_segment.getseg(ea)) == "extern":
-            continue
-
-        if ida_funcs.get_func(ea).flags & ida_funcs.FUNC_LIB != 0:
-            n += 1
-    return n
-
-
 class IdpHook(ida_idp.IDP_Hooks):
     def __init__(self):
         super().__init__()
@@ -85,12 +59,10 @@ class IdpHook(ida_idp.IDP_Hooks):
                 self.first = False
         else:
             if typee == ida_auto.AU_CHLB:  # load signature file
-                after = get_all_functions()
-                log(json.dumps(after))
-                # NOTE: We also log out this since we're running into an IDA/FLAIR bug where
-                #       recognized functions don't get renamed and stay named as `sub_...` (probably
-                #       related to the strange singular signature conflicts...)
-                log(str(get_number_of_lib_functions()))
+                # NOTE: The dump also contains the library function flag since we're running into
+                #       an IDA/FLAIR bug where recognized functions don't get renamed and stay named
+                #       as `sub_...` (probably related to the strange singular signature conflicts...)
+                export()
                 exit_if_batchmode()
                 self.unhook()
         return 0
@@ -108,7 +80,7 @@ if do_matching:
 else:
     # Wait for initial auto-analysis to complete
     ida_auto.auto_wait()
-    log(json.dumps(get_all_functions()))
+    export()
     exit_if_batchmode()
 
 # Our IDP hook waits until an "auto-analysis finished" event is triggered. We have to do it this way
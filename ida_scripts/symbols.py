@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import ida_funcs
+import ida_segment
+import idautils
+
+# The evaluation scripts live in the parent directory
+sys.path.append(str(Path(__file__).parent.parent))
+from symbol_dump import FLAG_LIB, FLAG_THUNK, DumpWriter  # noqa: E402
+
+# Shared between `get_symbols.py` (running inside IDA) and our idalib based evaluation server
+
+# Imports (Linux)
+EXCLUDED_SEGMENTS = ["extern"]
+
+
+def excluded_ranges():
+    ranges = []
+    for ea in idautils.Segments():
+        seg = ida_segment.getseg(ea)
+        if ida_segment.get_segm_name(seg) in EXCLUDED_SEGMENTS:
+            ranges.append((seg.start_ea, seg.end_ea))
+    return ranges
+
+
+# Yields `(address, size, name, flags)` for all functions in address order
+def iter_functions():
+    ranges = excluded_ranges()
+    for ea in idautils.Functions():
+        func = ida_funcs.get_func(ea)
+        # Assert that Lumina hasn't affected our results
+        assert func.flags & ida_funcs.FUNC_LUMINA == 0
+
+        if any(start <= ea < end for start, end in ranges):
+            continue
+        # For MSVC binaries this doesn't work since they thunk functions are just in the default
+        # .text segment. IDA does know that they're external symbols (since they're colored) but
+        # I don't know how to access that flag... Their addresses are stable though so they don't
+        # mess up our evaluation too much.
+
+        flags = 0
+        if func.flags & ida_funcs.FUNC_LIB:
+            flags |= FLAG_LIB
+        if func.flags & ida_funcs.FUNC_THUNK:
+            flags |= FLAG_THUNK
+        yield ea, func.size(), ida_funcs.get_func_name(ea), flags
+
+
+# Streams all functions into a symbol dump at `path`; returns the number of library functions
+def export_functions(path):
+    writer = DumpWriter(path)
+    lib_funcs = 0
+    try:
+        for ea, size, name, flags in iter_functions():
+            writer.add(ea, name, size, flags)
+            if flags & FLAG_LIB:
+                lib_funcs += 1
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close(lib_funcs)
+    return lib_funcs
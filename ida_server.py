@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import traceback
+from multiprocessing.connection import Listener
+from pathlib import Path
+
+# NOTE: `idapro` has to be imported before any of the other IDA modules
+import idapro
+import ida_auto
+import ida_funcs
+import ida_loader
+import ida_name
+import ida_segment
+import idautils
+
+import metrics
+from shared import FLAIR_PATH
+
+sys.path.append(str(Path(__file__).parent / "ida_scripts"))
+from symbols import export_functions  # noqa: E402
+
+# Long-lived idalib evaluation server. This avoids paying IDA's startup cost (plugin loading, Qt
+# initialization, ...) for every single reference/matching pass. `ida_runner.py` spawns one server
+# per worker and submits jobs over a local socket:
+#
+#   {"op": "open", "binary": ..., "args": ...}      open a fresh database (without auto-analysis)
+#   {"op": "analyze"}                               wait for auto-analysis to finish
+#   {"op": "match", "std": path, "sigs": [...]}     apply std signatures generated for the binary at
+#                                                   `std` and/or additional signatures
+#   {"op": "extract", "path": ...}                  write all functions as a symbol dump
+#   {"op": "strip_names"}                           remove all names (as if the binary was stripped)
+#   {"op": "save", "path": ...}                     save the (analyzed) database as a snapshot
+#   {"op": "close"}                                 close the database without saving
+#   {"op": "shutdown"}
+#
+# Every response also contains the wall time and CPU time the op took. The peak RSS isn't per op
+# (or binary) so it only gets recorded for the whole server once it exits (see ida_runner.py).
+#
+# NOTE: Our IDA plugin depends on the Qt event loop so we can't use it here. Instead we generate the
+#       std signatures with the `rust-sig-gen` CLI (which needs to be available in $PATH) just like
+#       evaluate_uniqueness.py does and apply them ourselves.
+
+
+def generate_std_sigs(binary):
+    # The database lives in the job's own working directory
+    out_dir = Path(ida_loader.get_path(ida_loader.PATH_TYPE_IDB)).parent / "std_sigs"
+    metrics.check_output(
+        ["rust-sig-gen", "-f", str(FLAIR_PATH), "-o", str(out_dir), "std", binary],
+        "rust-sig-gen std",
+        binary,
+    )
+    return sorted(out_dir.glob("*.sig"))
+
+
+# Segments whose names also survive stripping (imports)
+KEEP_NAMES_SEGMENTS = ["extern", ".idata"]
+
+
+def strip_names():
+    for ea, _ in list(idautils.Names()):
+        if ida_segment.get_segm_name(ida_segment.getseg(ea)) in KEEP_NAMES_SEGMENTS:
+            continue
+        # Function starts fall back to their dummy `sub_...` name
+        ida_name.set_name(ea, "", ida_name.SN_NOWARN)
+
+
+def handle(request):
+    match request["op"]:
+        case "open":
+            if request.get("args"):
+                ret = idapro.open_database(request["binary"], False, request["args"])
+            else:
+                ret = idapro.open_database(request["binary"], False)
+            if ret != 0:
+                raise RuntimeError(f"failed to open database ({ret})")
+        case "analyze":
+            ida_auto.auto_wait()
+        case "match":
+            sigs = [Path(p) for p in request.get("sigs", [])]
+            if request.get("std"):
+                sigs = generate_std_sigs(request["std"]) + sigs
+            for sig in sigs:
+                ida_funcs.plan_to_apply_idasgn(str(sig.absolute()))
+            ida_auto.auto_wait()
+        case "extract":
+            export_functions(request["path"])
+        case "strip_names":
+            strip_names()
+        case "save":
+            if not ida_loader.save_database(request["path"], ida_loader.DBFL_COMP):
+                raise RuntimeError("failed to save database")
+        case "close":
+            idapro.close_database(False)
+        case op:
+            raise ValueError(f"unknown op: {op}")
+
+
+def serve(address, authkey):
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        # Signal readiness to the spawning process
+        print("ready", flush=True)
+        with listener.accept() as conn:
+            while True:
+                request = conn.recv()
+                if request["op"] == "shutdown":
+                    break
+                started = time.monotonic()
+                cpu = time.process_time()
+                try:
+                    response = {"ok": True, "result": handle(request)}
+                except Exception:
+                    response = {"ok": False, "error": traceback.format_exc()}
+                response["usage"] = {
+                    "wall": time.monotonic() - started,
+                    "cpu": time.process_time() - cpu,
+                }
+                conn.send(response)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.stdin.buffer.readline().strip())
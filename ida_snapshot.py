@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+import idapro
+import ida_loader
+
+# Snapshots of analyzed idalib databases (used by uniqueness_worker.py and benchmark_worker.py).
+# Applying a signature to a reopened snapshot gives a pristine, already analyzed database without
+# rerunning the auto-analysis or replaying the (potentially huge) undo log of a full application.
+
+
+# Saves the currently open database as `snapshot` and closes it. The snapshot is stored
+# uncompressed so reopening it is as cheap as possible (and doesn't distort measurements).
+def save_snapshot(snapshot):
+    assert ida_loader.save_database(str(snapshot), 0)
+    idapro.close_database(False)
+
+
+# Opens `snapshot` for the duration of the block; it's already analyzed and never gets saved back
+@contextmanager
+def open_snapshot(snapshot):
+    assert idapro.open_database(str(snapshot), False) == 0
+    try:
+        yield
+    finally:
+        idapro.close_database(False)
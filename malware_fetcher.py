@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import shutil
+import tempfile
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from pyzipper import AESZipFile
+
+from artifact_store import BLOBS_PATH, link_blob
+
+# Fetches malware samples into the artifact store (`target/blobs/<sha256>`) which doubles as the
+# local sample cache so every sample is only downloaded once. Downloads are spooled to disk and
+# extracted in chunks and the extracted sample is only added to the store if its sha256 matches.
+#
+# Samples can come from either
+# - a MalwareBazaar compatible API (default; `--malware-source http://localhost:8000/` for a local
+#   stand-in, see `--serve` below) which returns password protected zips or
+# - a directory mirror containing `<sha256>.zip` (same format as MalwareBazaar) or plain
+#   `<sha256>` files (e.g. the `target/blobs/` directory of another machine).
+
+MALWARE_BAZAAR_URL = "https://mb-api.abuse.ch/api/v1/"
+MALWARE_ZIP_PASSWORD = b"infected"
+CHUNK_SIZE = 1 << 20
+
+
+class MalwareBazaar:
+    def __init__(self, url=MALWARE_BAZAAR_URL):
+        self.url = url
+        # MalwareBazaar requires an API key nowadays; local stand-ins don't
+        auth_key = os.environ.get("MALWARE_BAZAAR_AUTH_KEY")
+        self.headers = {"Auth-Key": auth_key} if auth_key else {}
+
+    # Writes the sample to `f`; returns whether it's zipped
+    def fetch(self, sha256, f):
+        with requests.post(
+            self.url,
+            data={"query": "get_file", "sha256_hash": sha256},
+            headers=self.headers,
+            stream=True,
+            timeout=60,
+        ) as response:
+            response.raise_for_status()
+            # Errors (e.g. unknown hashes) are reported as JSON instead of an HTTP status
+            if response.headers.get("content-type", "").startswith("application/json"):
+                raise RuntimeError(f"{self.url}: {response.json().get('query_status')}")
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+        return True
+
+    def __str__(self):
+        return self.url
+
+
+class DirectoryMirror:
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def fetch(self, sha256, f):
+        for name, zipped in [(f"{sha256}.zip", True), (sha256, False)]:
+            if (self.path / name).exists():
+                with open(self.path / name, "rb") as src:
+                    shutil.copyfileobj(src, f, CHUNK_SIZE)
+                return zipped
+        raise FileNotFoundError(f"{sha256} not in mirror {self.path}")
+
+    def __str__(self):
+        return str(self.path)
+
+
+def malware_source(spec):
+    if spec is None:
+        return MalwareBazaar()
+    if spec.startswith(("http://", "https://")):
+        return MalwareBazaar(spec)
+    return DirectoryMirror(spec)
+
+
+def copy_and_hash(src, dst):
+    h = hashlib.sha256()
+    while chunk := src.read(CHUNK_SIZE):
+        h.update(chunk)
+        dst.write(chunk)
+    return h.hexdigest()
+
+
+# Makes sure the sample is in the artifact store
+def fetch_sample(source, sha256):
+    blob = BLOBS_PATH / sha256
+    if blob.exists():
+        # Samples fetched by earlier versions were stored executable
+        blob.chmod(0o444)
+        return
+    BLOBS_PATH.mkdir(parents=True, exist_ok=True)
+
+    tmp_blob = BLOBS_PATH / f".{sha256}.fetch"
+    try:
+        # Zips need to be seekable so spool the download to disk instead of keeping it in memory
+        with tempfile.TemporaryFile() as download, open(tmp_blob, "wb") as out:
+            zipped = source.fetch(sha256, download)
+            download.seek(0)
+            if zipped:
+                with AESZipFile(download) as zip_file:
+                    with zip_file.open(zip_file.filelist[0], pwd=MALWARE_ZIP_PASSWORD) as sample:
+                        digest = copy_and_hash(sample, out)
+            else:
+                digest = copy_and_hash(download, out)
+        if digest != sha256:
+            raise RuntimeError(f"sha256 mismatch (got {digest}) from {source}")
+        # Read-only and, like the rest of target/malware/, never executable
+        tmp_blob.chmod(0o444)
+        tmp_blob.replace(blob)
+    finally:
+        tmp_blob.unlink(missing_ok=True)
+
+
+# Fetches all samples concurrently and links them to `out_dir/<name>.do_not_exec`. A failed sample
+# doesn't affect the others. Returns Map: sample path -> sha256 and the failures as
+# `(name, sha256, exception)`
+def fetch_samples(samples, out_dir, source=None, jobs=8):
+    source = malware_source(source)
+    hashes = sorted({sha256 for sha256, _ in samples})
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = {sha256: executor.submit(fetch_sample, source, sha256) for sha256 in hashes}
+
+    failures = []
+    paths = {}
+    for sha256, name in samples:
+        try:
+            futures[sha256].result()
+        except Exception as e:
+            failures.append((name, sha256, e))
+            continue
+        out_path = out_dir / f"{name}.do_not_exec"
+        link_blob(sha256, out_path)
+        paths[out_path] = sha256
+    return paths, failures
+
+
+def add_malware_arguments(parser):
+    parser.add_argument(
+        "--malware-source",
+        help="URL of a MalwareBazaar compatible API or directory mirror to fetch the samples from",
+    )
+    parser.add_argument(
+        "--fetch-jobs",
+        type=int,
+        default=8,
+        help="number of malware samples to download concurrently",
+    )
+
+
+# Minimal MalwareBazaar stand-in serving the `<sha256>.zip` files of a directory
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    mirror_path = None
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        query = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        zip_path = self.mirror_path / f"{query.get('sha256_hash', '')}.zip"
+        if query.get("query") != "get_file" or not zip_path.is_file():
+            body = json.dumps({"query_status": "file_not_found"}).encode()
+            content_type = "application/json"
+        else:
+            body = zip_path.read_bytes()
+            content_type = "application/zip"
+        self.send_response(200)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--serve",
+        type=Path,
+        required=True,
+        help="directory with `<sha256>.zip` files to serve as a MalwareBazaar stand-in",
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    StandInHandler.mirror_path = args.serve
+    print(f"Serving {args.serve} on http://localhost:{args.port}/")
+    http.server.ThreadingHTTPServer(("localhost", args.port), StandInHandler).serve_forever()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from shared import TARGET_PATH
+
+# Wall time, CPU time and peak RSS of every subprocess the evaluation launches (cargo, strip,
+# IDA, rust-sig-gen, ...), appended as one JSON line per process to target/metrics.jsonl. Running
+# this script prints a report of the slowest stages and binaries.
+#
+# NOTE: The peak RSS is sampled from /proc instead of taken from `ru_maxrss` since Linux carries
+#       that over fork and exec, i.e. every child would report at least its parent's RSS (e.g.
+#       `rust-sig-gen` launched by an idalib server holding a whole IDA database).
+
+METRICS_PATH = TARGET_PATH / "metrics.jsonl"
+RSS_SAMPLE_INTERVAL = 0.1
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+lock = threading.Lock()
+
+
+def record(stage, binary, wall, cpu, max_rss, detail=None):
+    if binary is not None:
+        binary = Path(binary)
+        if binary.is_absolute() and binary.is_relative_to(Path.cwd()):
+            binary = binary.relative_to(Path.cwd())
+        # Stripped copies count towards their binary
+        binary = str(binary).removesuffix(".stripped")
+    line = json.dumps(
+        {
+            "time": time.time(),
+            "stage": stage,
+            "binary": binary,
+            "detail": detail,
+            "wall": wall,
+            "cpu": cpu,
+            "max_rss": max_rss,
+        }
+    )
+    with lock:
+        METRICS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # Single small appends so concurrent writers don't interleave
+        with open(METRICS_PATH, "a") as f:
+            f.write(line + "\n")
+
+
+# Value of a `/proc/<pid>/status` field in bytes; `None` if the process (or its memory) is gone
+def status_bytes(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    # Always in kB
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return None
+
+
+def descendants(pid):
+    pids = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                pids += [int(child) for child in f.read().split()]
+    except (FileNotFoundError, ProcessLookupError):
+        return []
+    return pids + [p for child in pids for p in descendants(child)]
+
+
+# User + system CPU time of a process including all descendants it waited for (same as the
+# `rusage` of `wait4()`); `None` if it has been reaped already
+def cpu_time(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    # utime, stime, cutime and cstime
+    return sum(int(field) for field in fields[11:15]) / CLOCK_TICKS
+
+
+# Watches a child until it exits without reaping it (via a pidfd) so its CPU time can still be
+# read from /proc afterwards. Meanwhile it samples the peak RSS of the process tree: the maximum of
+# the summed RSS of the process and all its descendants (e.g. rustc under cargo) and of the
+# process' own high water mark.
+class ProcessMonitor(threading.Thread):
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.pidfd = os.pidfd_open(pid)
+        self.peak = None
+        self.cpu = None
+
+    def sample(self):
+        rss = [status_bytes(p, "VmRSS") for p in [self.pid] + descendants(self.pid)]
+        values = [sum(r for r in rss if r is not None), status_bytes(self.pid, "VmHWM") or 0]
+        if any(r is not None for r in rss):
+            self.peak = max([self.peak or 0] + values)
+
+    def run(self):
+        try:
+            poller = select.poll()
+            poller.register(self.pidfd, select.POLLIN)
+            self.sample()
+            # The pidfd becomes readable once the process exited
+            while not poller.poll(RSS_SAMPLE_INTERVAL * 1000):
+                self.sample()
+            self.cpu = cpu_time(self.pid)
+        finally:
+            os.close(self.pidfd)
+
+
+# Records the process' metrics once it exited. `wait()` and `poll()` (which `communicate()` and
+# the context manager go through as well) only reap the process once the monitor is done with it.
+class Popen(subprocess.Popen):
+    def __init__(self, args, stage, binary=None, detail=None, **kwargs):
+        self.stage = stage
+        self.binary = binary
+        self.detail = detail
+        self.started = time.monotonic()
+        self.recorded = False
+        super().__init__(args, **kwargs)
+        self.monitor = ProcessMonitor(self.pid)
+        self.monitor.start()
+
+    def wait(self, timeout=None):
+        self.monitor.join(timeout)
+        if self.monitor.is_alive():
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        returncode = super().wait()
+        self.record()
+        return returncode
+
+    def poll(self):
+        if self.monitor.is_alive():
+            return None
+        returncode = super().poll()
+        self.record()
+        return returncode
+
+    def record(self):
+        if self.recorded:
+            return
+        self.recorded = True
+        record(
+            self.stage,
+            self.binary,
+            time.monotonic() - self.started,
+            self.monitor.cpu,
+            # `None` for processes which exited before the first sample
+            self.monitor.peak,
+            self.detail,
+        )
+
+
+# Same as their `subprocess` counterparts except for recording the process' metrics
+def check_output(args, stage, binary=None, detail=None, **kwargs):
+    with Popen(args, stage, binary, detail, stdout=subprocess.PIPE, **kwargs) as process:
+        output, _ = process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, output)
+    return output
+
+
+def check_call(args, stage, binary=None, detail=None, **kwargs):
+    with Popen(args, stage, binary, detail, **kwargs) as process:
+        process.wait()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+
+
+def load(path, stage_filter, binary_filter, keep_all):
+    entries = {}
+    with open(path) as f:
+        for i, line in enumerate(f):
+            entry = json.loads(line)
+            if stage_filter and not re.search(stage_filter, entry["stage"]):
+                continue
+            if binary_filter and not re.search(binary_filter, entry["binary"] or ""):
+                continue
+            # By default only the latest run of every step counts
+            key = i if keep_all else (entry["stage"], entry["binary"], entry["detail"])
+            entries[key] = entry
+    return list(entries.values())
+
+
+def format_row(name, count, wall, cpu, max_rss):
+    max_rss = f"{max_rss / 2**20:9.0f}MiB" if max_rss is not None else f"{'-':>12}"
+    return f"  {wall:10.1f}s {cpu:10.1f}s {max_rss} {count:6}  {name}"
+
+
+def report(entries, top):
+    header = f"  {'wall':>11} {'cpu':>11} {'peak rss':>12} {'count':>6}"
+
+    stages = defaultdict(list)
+    binaries = defaultdict(list)
+    for entry in entries:
+        stages[entry["stage"]].append(entry)
+        if entry["binary"]:
+            binaries[entry["binary"]].append(entry)
+
+    def aggregate(groups):
+        rows = [
+            (
+                name,
+                len(group),
+                sum(e["wall"] for e in group),
+                sum(e["cpu"] or 0 for e in group),
+                # E.g. idalib ops don't have their own peak RSS
+                max((e["max_rss"] for e in group if e["max_rss"] is not None), default=None),
+            )
+            for name, group in groups.items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    print("Stages:")
+    print(header)
+    for row in aggregate(stages):
+        print(format_row(*row))
+
+    print(f"\nSlowest binaries (top {top}):")
+    print(header)
+    for row in aggregate(binaries)[:top]:
+        print(format_row(*row))
+
+    print(f"\nSlowest processes (top {top}):")
+    print(header)
+    for e in sorted(entries, key=lambda e: e["wall"], reverse=True)[:top]:
+        name = " ".join(
+            [e["stage"]]
+            + ([e["binary"]] if e["binary"] else [])
+            + ([f"({e['detail']})"] if e["detail"] else [])
+        )
+        print(format_row(name, 1, e["wall"], e["cpu"] or 0, e["max_rss"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=20, help="number of entries to list")
+    parser.add_argument("--stage", help="optional regex to filter stages")
+    parser.add_argument("--binary", help="optional regex to filter binaries")
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="include all recorded runs instead of only the latest one of every step",
+    )
+    args = parser.parse_args()
+
+    report(load(METRICS_PATH, args.stage, args.binary, args.all), args.top)
@@ -0,0 +1,22 @@
+import re
+
+# Symbol name normalization shared by classify.py and native_symbols.py. Kept separate from
+# classify.py so tools which only compare names don't pull in the demangler.
+
+DUMMY_NAME_RE = re.compile(r"(sub|unknown_libname)_\d+$")
+NUMBER_SUFFIX_RE = re.compile(r"_\d+$")
+
+
+def remove_number_suffix(symbol: str):
+    if DUMMY_NAME_RE.match(symbol):
+        return symbol
+    else:
+        return NUMBER_SUFFIX_RE.sub("", symbol)
+
+
+# Strip trailing _0, _1, ... which gets added by IDA (I believe since the same signature is in
+# multiple signature libraries?) We need this since it messes up the demangler and it doesn't
+# matter to our goal. Also strip out leading/trailing `_` which don't matter and are sometimes
+# different between real and matched name...
+def clean_name(symbol: str):
+    return remove_number_suffix(symbol).strip("_")
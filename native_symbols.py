@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+import argparse
+import mmap
+import re
+import struct
+from pathlib import Path
+
+from names import clean_name
+from registry import select
+from symbol_dump import FLAG_NATIVE, DumpWriter, open_dump
+from shared import TARGET_PATH
+
+# Ground truth function symbols without IDA. Instead of a full auto-analysis of the unstripped binary
+# we read the symbols directly from
+# - ELF: `.symtab` (or `.dynsym` if there's none)
+# - PE (MinGW): the COFF symbol table
+# - PE (MSVC): the `.pdb` next to the binary (public symbols + procedures of all modules)
+# and write them in the same format as the IDA based `.reference` dumps with every function marked
+# as `FLAG_NATIVE` (with the sizes from `.symtab` or the `.pdb` procedures). evaluate_std.py and
+# evaluate_crates.py skip the IDA reference pass (and `--snapshot`) for binaries which already have
+# one and report the native ones they reused; summary.py marks binaries evaluated against them.
+#
+# NOTE: Functions IDA discovers during auto-analysis but which have no symbol (`sub_...`) are
+#       missing from these references so `total`/`unknown` differ from IDA based ones.
+#       `--reconcile` compares against existing IDA references.
+
+EVALUATION_PATH = TARGET_PATH / "evaluation"
+
+# ELF
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+SHN_UNDEF = 0
+# Preference if there are multiple symbols for the same address
+ELF_BINDING_PRIORITY = {1: 0, 2: 1, 0: 2}  # GLOBAL, WEAK, LOCAL
+
+# PE/COFF
+COFF_SYMBOL = struct.Struct("<8sIhHBB")
+IMAGE_SYM_DTYPE_FUNCTION = 2
+
+# PDB
+MSF_MAGIC = b"Microsoft C/C++ MSF 7.00\r\n\x1aDS\0\0\0"
+DBI_STREAM = 3
+DBI_HEADER = struct.Struct("<iIIHHHHHHiiiiiIiiHHI")
+MODULE_INFO = struct.Struct("<I28sHHIIIHHIII")
+SECTION_HEADER = struct.Struct("<8sIIIIIIHHI")
+OPTIONAL_DBG_SECTION_HEADERS = 5
+S_PUB32 = 0x110E
+S_LPROC32 = 0x110F
+S_GPROC32 = 0x1110
+S_LPROC32_ID = 0x1146
+S_GPROC32_ID = 0x1147
+CVPSF_FUNCTION = 0x2
+
+
+def read_cstring(data, offset):
+    end = data.find(b"\0", offset)
+    return data[offset:end].decode("utf-8", "replace")
+
+
+def elf_functions(data):
+    if data[4] == 2:
+        header = struct.unpack_from("<QQIHHHHHH", data, 0x20)
+        shoff, shentsize, shnum = header[1], header[6], header[7]
+        section = struct.Struct("<IIQQQQIIQQ")
+        symbol = struct.Struct("<IBBHQQ")
+        unpack_symbol = lambda s: s  # noqa: E731
+    else:
+        header = struct.unpack_from("<IIIHHHHHH", data, 0x1C)
+        shoff, shentsize, shnum = header[1], header[6], header[7]
+        section = struct.Struct("<IIIIIIIIII")
+        symbol = struct.Struct("<IIIBBH")
+        # Same field order as the 64-bit symbols
+        unpack_symbol = lambda s: (s[0], s[3], s[4], s[5], s[1], s[2])  # noqa: E731
+
+    sections = [section.unpack_from(data, shoff + i * shentsize) for i in range(shnum)]
+    symtabs = {s[1]: s for s in sections if s[1] in [SHT_SYMTAB, SHT_DYNSYM]}
+    symtab = symtabs.get(SHT_SYMTAB, symtabs.get(SHT_DYNSYM))
+    if symtab is None:
+        return {}
+    sym_offset, sym_size, link = symtab[4], symtab[5], symtab[6]
+    strtab_offset = sections[link][4]
+
+    functions = {}
+    priorities = {}
+    for raw in symbol.iter_unpack(data[sym_offset : sym_offset + sym_size]):
+        name, info, _, shndx, value, size = unpack_symbol(raw)
+        if info & 0xF not in [STT_FUNC, STT_GNU_IFUNC] or shndx == SHN_UNDEF or not value:
+            continue
+        priority = ELF_BINDING_PRIORITY.get(info >> 4, 3)
+        if value not in functions or priority < priorities[value]:
+            functions[value] = (read_cstring(data, strtab_offset + name), size)
+            priorities[value] = priority
+    return functions
+
+
+def pe_headers(data):
+    pe_offset = struct.unpack_from("<I", data, 0x3C)[0]
+    assert data[pe_offset : pe_offset + 4] == b"PE\0\0", "not a PE file"
+    _, n_sections, _, symtab_offset, n_symbols, optional_size, _ = struct.unpack_from(
+        "<HHIIIHH", data, pe_offset + 4
+    )
+    optional_offset = pe_offset + 24
+    if struct.unpack_from("<H", data, optional_offset)[0] == 0x20B:
+        image_base = struct.unpack_from("<Q", data, optional_offset + 24)[0]
+    else:
+        image_base = struct.unpack_from("<I", data, optional_offset + 28)[0]
+    sections_offset = optional_offset + optional_size
+    section_rvas = [
+        SECTION_HEADER.unpack_from(data, sections_offset + i * SECTION_HEADER.size)[2]
+        for i in range(n_sections)
+    ]
+    return image_base, section_rvas, symtab_offset, n_symbols
+
+
+def coff_functions(data):
+    image_base, section_rvas, symtab_offset, n_symbols = pe_headers(data)
+    strings_offset = symtab_offset + n_symbols * COFF_SYMBOL.size
+
+    functions = {}
+    i = 0
+    while i < n_symbols:
+        name, value, section, type_, _, n_aux = COFF_SYMBOL.unpack_from(
+            data, symtab_offset + i * COFF_SYMBOL.size
+        )
+        i += 1 + n_aux
+        if type_ >> 4 != IMAGE_SYM_DTYPE_FUNCTION or section <= 0:
+            continue
+        if name[:4] == b"\0\0\0\0":
+            name = read_cstring(data, strings_offset + struct.unpack_from("<I", name, 4)[0])
+        else:
+            name = name.rstrip(b"\0").decode("utf-8", "replace")
+        # The COFF symbol table has no sizes
+        functions.setdefault(image_base + section_rvas[section - 1] + value, (name, 0))
+    return functions
+
+
+class Msf:
+    def __init__(self, data):
+        assert data[: len(MSF_MAGIC)] == MSF_MAGIC, "not a PDB file"
+        self.data = data
+        self.block_size, _, _, directory_size, _, block_map = struct.unpack_from(
+            "<IIIIII", data, len(MSF_MAGIC)
+        )
+        n_blocks = -(-directory_size // self.block_size)
+        directory_blocks = struct.unpack_from(f"<{n_blocks}I", data, block_map * self.block_size)
+        directory = self.read_blocks(directory_blocks, directory_size)
+
+        n_streams = struct.unpack_from("<I", directory)[0]
+        sizes = struct.unpack_from(f"<{n_streams}I", directory, 4)
+        offset = 4 + 4 * n_streams
+        self.streams = []
+        for size in sizes:
+            if size == 0xFFFFFFFF:
+                size = 0
+            n = -(-size // self.block_size)
+            self.streams.append((size, struct.unpack_from(f"<{n}I", directory, offset)))
+            offset += 4 * n
+
+    def read_blocks(self, blocks, size):
+        bs = self.block_size
+        return b"".join(self.data[b * bs : (b + 1) * bs] for b in blocks)[:size]
+
+    def stream(self, index):
+        size, blocks = self.streams[index]
+        return self.read_blocks(blocks, size)
+
+
+def symbol_records(data, offset, end):
+    while offset + 4 <= end:
+        length, kind = struct.unpack_from("<HH", data, offset)
+        yield kind, offset + 4
+        offset += 2 + length
+
+
+def pdb_functions(pdb_data, image_base):
+    msf = Msf(pdb_data)
+    dbi = msf.stream(DBI_STREAM)
+    header = DBI_HEADER.unpack(dbi[: DBI_HEADER.size])
+    sym_record_stream = header[7]
+    module_info_size, section_contribution_size, section_map_size = header[9:12]
+    source_info_size, type_server_map_size = header[12:14]
+    optional_dbg_header_size, ec_size = header[15:17]
+
+    # Section headers (from the optional debug header) to turn `segment:offset` into RVAs
+    dbg_offset = DBI_HEADER.size + sum(
+        [
+            module_info_size,
+            section_contribution_size,
+            section_map_size,
+            source_info_size,
+            type_server_map_size,
+            ec_size,
+        ]
+    )
+    dbg_streams = struct.unpack_from(f"<{optional_dbg_header_size // 2}H", dbi, dbg_offset)
+    section_headers = msf.stream(dbg_streams[OPTIONAL_DBG_SECTION_HEADERS])
+    section_rvas = [s[2] for s in SECTION_HEADER.iter_unpack(section_headers)]
+
+    def address(segment, offset):
+        return image_base + section_rvas[segment - 1] + offset
+
+    # Public symbols take precedence since that's what IDA names the functions after
+    functions = {}
+    # Only procedures have a size
+    sizes = {}
+    records = msf.stream(sym_record_stream)
+    for kind, offset in symbol_records(records, 0, len(records)):
+        if kind != S_PUB32:
+            continue
+        flags, sym_offset, segment = struct.unpack_from("<IIH", records, offset)
+        if flags & CVPSF_FUNCTION and 0 < segment <= len(section_rvas):
+            functions.setdefault(
+                address(segment, sym_offset), read_cstring(records, offset + 10)
+            )
+
+    # Procedures without a public symbol (e.g. internal functions)
+    offset = DBI_HEADER.size
+    end = offset + module_info_size
+    while offset < end:
+        module = MODULE_INFO.unpack_from(dbi, offset)
+        module_stream, sym_size = module[3], module[4]
+        offset += MODULE_INFO.size
+        # Module and object file name
+        for _ in range(2):
+            offset = dbi.index(b"\0", offset) + 1
+        offset = (offset + 3) & ~3
+
+        if module_stream == 0xFFFF:
+            continue
+        symbols = msf.stream(module_stream)
+        # Skip the signature
+        for kind, sym_offset in symbol_records(symbols, 4, sym_size):
+            if kind not in [S_GPROC32, S_LPROC32, S_GPROC32_ID, S_LPROC32_ID]:
+                continue
+            code_size = struct.unpack_from("<I", symbols, sym_offset + 12)[0]
+            proc_offset, segment = struct.unpack_from("<IH", symbols, sym_offset + 28)
+            if 0 < segment <= len(section_rvas):
+                addr = address(segment, proc_offset)
+                functions.setdefault(addr, read_cstring(symbols, sym_offset + 35))
+                sizes.setdefault(addr, code_size)
+    return {addr: (name, sizes.get(addr, 0)) for addr, name in functions.items()}
+
+
+# Map: address -> (name, size) of all functions with a symbol (same as `get_all_functions()`); the
+# size is 0 if unknown
+def extract_functions(unstripped, stripped):
+    with open(unstripped, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:4] == b"\x7fELF":
+            return elf_functions(data)
+        if stripped.endswith(".pdb"):
+            image_base, *_ = pe_headers(data)
+            with open(stripped, "rb") as pdb, mmap.mmap(
+                pdb.fileno(), 0, access=mmap.ACCESS_READ
+            ) as pdb_data:
+                return pdb_functions(pdb_data, image_base)
+        return coff_functions(data)
+
+
+def write_reference(unstripped, stripped, out_path_ref):
+    out_path_ref.parent.mkdir(parents=True, exist_ok=True)
+    writer = DumpWriter(out_path_ref)
+    for addr, (name, size) in sorted(extract_functions(unstripped, stripped).items()):
+        writer.add(addr, name, size, FLAG_NATIVE)
+    writer.close()
+
+
+def reconcile(unstripped, stripped, out_path_ref, verbose):
+    reference = open_dump(out_path_ref)
+    if reference.is_native():
+        print(f"{unstripped}\n  existing reference is native as well")
+        return
+    native = {addr: name for addr, (name, _) in extract_functions(unstripped, stripped).items()}
+    ida = dict(reference.items())
+
+    same, different, only_native, only_ida, ida_dummy = 0, [], [], [], 0
+    for addr, name in ida.items():
+        if addr in native:
+            if clean_name(name) == clean_name(native[addr]):
+                same += 1
+            else:
+                different.append((addr, native[addr], name))
+        elif name.startswith("sub_"):
+            ida_dummy += 1
+        else:
+            only_ida.append((addr, name))
+    only_native = [(addr, name) for addr, name in native.items() if addr not in ida]
+
+    print(unstripped)
+    print(
+        f"  same: {same}, different: {len(different)}, only native: {len(only_native)}, "
+        f"only IDA: {len(only_ida)}, unnamed in IDA: {ida_dummy}"
+    )
+    if verbose:
+        for addr, native_name, ida_name in different:
+            print(f"    {addr:#x}: {native_name} (native) != {ida_name} (IDA)")
+        for addr, name in only_native:
+            print(f"    {addr:#x}: {name} (only native)")
+        for addr, name in only_ida:
+            print(f"    {addr:#x}: {name} (only IDA)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "filter", nargs="?", help="optional regex to filter which binaries to consider"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="overwrite existing reference dumps"
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="compare with the existing (IDA generated) reference dumps instead of writing them",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="list all disagreements with --reconcile"
+    )
+    args = parser.parse_args()
+
+    binaries = select(exclude=["uniqueness"])
+
+    for unstripped, stripped in binaries.items():
+        # No ground truth for binaries without symbols
+        if unstripped == stripped:
+            continue
+        if args.filter and not re.search(args.filter, unstripped):
+            continue
+
+        rel_path = Path(unstripped).relative_to(TARGET_PATH)
+        out_path = EVALUATION_PATH / rel_path
+        out_path_ref = out_path.with_suffix(out_path.suffix + ".reference")
+        if args.reconcile:
+            if out_path_ref.exists():
+                reconcile(unstripped, stripped, out_path_ref, args.verbose)
+        elif args.force or not out_path_ref.exists():
+            print(unstripped)
+            write_reference(unstripped, stripped, out_path_ref)
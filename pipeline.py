@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from build import (
+    MALWARE,
+    Jobserver,
+    artifact_hashes,
+    build_cell,
+    build_failures,
+    cell_outputs,
+    examples_cells,
+    get_malware_samples,
+    oss_cells,
+    prepare_oss_project,
+    prepare_toolchains,
+    resolve_lockfile,
+    uniqueness_cells,
+)
+import metrics
+from artifact_store import link_or_copy
+from evaluate_crates import FLAGS, SIGNATURES_PATH, generate_crate_sigs
+from ida_runner import (
+    IDA_SCRIPT_PATH,
+    IDA_SERVER_PATH,
+    IdaJob,
+    IdalibRunner,
+    add_ida_arguments,
+    run_ida,
+    run_job,
+)
+from malware_fetcher import add_malware_arguments
+from native_symbols import write_reference
+from registry import write_registry
+from shared import (
+    TARGET_PATH,
+    flair_version,
+    hash_file,
+    hash_sources,
+    ida_version,
+    rust_sig_gen_version,
+)
+
+# Make-style runner for the whole evaluation (build.py -> evaluate_std.py / evaluate_crates.py ->
+# summary.py). Every step of every binary is a node in a DAG. Ready nodes run in parallel as long as
+# their resources (concurrent cargo builds, IDA instances, RAM in GB) are available. A node only
+# reruns if its outputs are missing or the content of its inputs changed since its last successful
+# run so e.g. rebuilding a single binary only reevaluates that binary.
+#
+# NOTE: Stripping happens as part of the build nodes since the build cache stores the stripped
+#       artifacts alongside the unstripped ones.
+
+EVALUATION_PATH = TARGET_PATH / "evaluation"
+PIPELINE_STATE_PATH = TARGET_PATH / "pipeline_state.json"
+
+
+class Node:
+    def __init__(
+        self,
+        name,
+        action,
+        deps=(),
+        inputs=(),
+        outputs=(),
+        key="",
+        resources=None,
+        always=False,
+        after=(),
+    ):
+        self.name = name
+        self.action = action
+        self.deps = [dep.name for dep in deps]
+        # Only ordering; the node still runs if any of these fail
+        self.after = [node.name for node in after]
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        # Anything besides the inputs' content which influences the result (e.g. flags)
+        self.key = key
+        self.resources = resources or {}
+        # Nodes with their own caching (e.g. builds) always run
+        self.always = always
+
+    def stamp(self):
+        h = hashlib.sha256(f"{self.name} {self.key}".encode())
+        for path in self.inputs:
+            files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+            for file in files:
+                h.update(str(file).encode())
+                h.update(hash_file(file).encode() if file.exists() else b"missing")
+        return h.hexdigest()
+
+    def up_to_date(self, stamp, old_stamp):
+        return (
+            not self.always
+            and stamp == old_stamp
+            and all(p.exists() for p in self.outputs)
+        )
+
+
+class Pipeline:
+    def __init__(self, limits):
+        self.limits = limits
+        self.nodes = {}
+
+    def add(self, *args, **kwargs):
+        node = Node(*args, **kwargs)
+        assert node.name not in self.nodes, f"duplicate node {node.name}"
+        self.nodes[node.name] = node
+        return node
+
+    def requirements(self, node):
+        # A node asking for more than available would never run so let it have everything instead
+        return {r: min(n, self.limits[r]) for r, n in node.resources.items()}
+
+    def execute(self, node, old_stamp):
+        stamp = node.stamp()
+        if node.up_to_date(stamp, old_stamp):
+            return stamp, False
+        node.action()
+        return stamp, True
+
+    def run(self, state, workers):
+        pending = dict(self.nodes)
+        done = set()
+        failed = set()
+        in_use = {r: 0 for r in self.limits}
+        running = {}
+
+        with ThreadPoolExecutor(workers) as executor:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if any(dep in failed for dep in node.deps):
+                        print(f"Skipping {name} (dependency failed)")
+                        failed.add(name)
+                        del pending[name]
+
+                for name, node in list(pending.items()):
+                    if not all(dep in done for dep in node.deps):
+                        continue
+                    if not all(dep in done or dep in failed for dep in node.after):
+                        continue
+                    needed = self.requirements(node)
+                    if any(in_use[r] + n > self.limits[r] for r, n in needed.items()):
+                        continue
+                    for r, n in needed.items():
+                        in_use[r] += n
+                    future = executor.submit(self.execute, node, state.get(name))
+                    running[future] = node
+                    del pending[name]
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    for r, n in self.requirements(node).items():
+                        in_use[r] -= n
+                    try:
+                        stamp, ran = future.result()
+                    except Exception as e:
+                        print(f"Failed {node.name}: {e}")
+                        failed.add(node.name)
+                        continue
+                    done.add(node.name)
+                    state[node.name] = stamp
+                    if ran:
+                        print(f"Finished {node.name}")
+                        # Persist after every node so an interrupted run keeps its progress
+                        with open(PIPELINE_STATE_PATH, "w") as f:
+                            f.write(json.dumps(state))
+        return failed
+
+
+def total_ram_gb():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**30
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--only", help="optional regex to filter which binaries to consider (like summary.py)"
+)
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=os.cpu_count(),
+    help="total number of jobs shared by all concurrently running cargo processes",
+)
+parser.add_argument(
+    "--cells",
+    type=int,
+    default=4,
+    help="maximum number of cargo builds (incl. crate signature generation) at once",
+)
+parser.add_argument(
+    "--ram",
+    type=int,
+    default=total_ram_gb(),
+    help="amount of RAM in GB available to the pipeline",
+)
+parser.add_argument(
+    "--ram-per-ida",
+    type=int,
+    default=8,
+    help="RAM in GB reserved for every IDA instance",
+)
+parser.add_argument(
+    "--native-reference",
+    action="store_true",
+    help="read the ground truth symbols directly from the binaries instead of using IDA",
+)
+add_ida_arguments(parser)
+add_malware_arguments(parser)
+args = parser.parse_args()
+if args.snapshot:
+    parser.error("--snapshot is not supported by the pipeline")
+
+TARGET_PATH.mkdir(exist_ok=True)
+try:
+    with open(PIPELINE_STATE_PATH) as f:
+        state = json.loads(f.read())
+except FileNotFoundError:
+    state = {}
+
+pipeline = Pipeline({"cargo": args.cells, "ida": args.workers, "ram": args.ram})
+jobserver = Jobserver(args.jobs, args.cells)
+runner = IdalibRunner() if args.backend == "idalib" else run_ida
+
+
+def selected(path):
+    return not args.only or re.search(args.only, str(path))
+
+
+def ida_action(job):
+    def action():
+        error = run_job(job, runner, args.timeout, args.retries)
+        if error:
+            raise error
+
+    return action
+
+
+def native_reference_action(unstripped, stripped, out_path_ref):
+    def action():
+        write_reference(unstripped, str(stripped), out_path_ref)
+
+    return action
+
+
+# Byte-identical binaries (e.g. hello_world across adjacent toolchains) are only evaluated once per
+# run like in evaluate_std.py/evaluate_crates.py (see `dedupe()`); the content hashes are only
+# known once the binaries are built so this happens when the nodes run. The first node of a group
+# runs its action and the others wait for it and link its output (see `fan_out()`).
+evaluated = {}
+evaluated_lock = threading.Lock()
+
+
+def deduped(kind, paths, out_path, action, extra=None):
+    def run():
+        hashes = [artifact_hashes.get(Path(p)) or hash_file(p) for p in paths]
+        with evaluated_lock:
+            first = evaluated.get((kind, *hashes, extra))
+            if first is None:
+                evaluated[kind, *hashes, extra] = result = Future()
+        if first is None:
+            try:
+                action()
+            except Exception as e:
+                result.set_exception(e)
+                raise
+            result.set_result(out_path)
+        else:
+            src = first.result()
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(src, out_path)
+
+    return run
+
+
+toolchains = pipeline.add("toolchains", prepare_toolchains, always=True)
+
+# Build nodes; Map: category -> {unstripped bin -> stripped bin}
+categories = {"examples": {}, "oss_projects": {}, "malware_samples": {}, "uniqueness": {}}
+build_nodes = {}
+prepared_projects = {}
+matrix = [
+    ("examples", examples_cells()),
+    ("oss_projects", oss_cells()),
+    ("uniqueness", uniqueness_cells()),
+]
+# Toolchains every package gets built with; it's resolved once before any of its cells get built
+# (see `resolve_lockfile()`)
+package_versions = {}
+for _, cells in matrix:
+    for crate_dir, version, *_ in cells:
+        package_versions.setdefault(crate_dir, []).append(version)
+lockfile_nodes = {}
+for category, cells in matrix:
+    for cell in cells:
+        outputs = cell_outputs(cell)
+        categories[category] |= outputs
+        if not any(selected(unstripped) for unstripped in outputs):
+            continue
+
+        crate_dir, version, target, mode, _ = cell
+        deps = [toolchains]
+        if category == "oss_projects":
+            if crate_dir not in prepared_projects:
+                prepared_projects[crate_dir] = pipeline.add(
+                    f"prepare:{crate_dir}",
+                    lambda crate_dir=crate_dir: prepare_oss_project(crate_dir),
+                    always=True,
+                )
+            deps.append(prepared_projects[crate_dir])
+        if crate_dir not in lockfile_nodes:
+            lockfile_nodes[crate_dir] = pipeline.add(
+                f"lockfile:{crate_dir}",
+                lambda crate_dir=crate_dir: resolve_lockfile(
+                    crate_dir, package_versions[crate_dir]
+                ),
+                deps=deps,
+                always=True,
+            )
+        deps = [lockfile_nodes[crate_dir]]
+
+        name = f"build:{crate_dir}:{version}:{target}:{mode}"
+        if name in pipeline.nodes:
+            # Same cell in multiple categories
+            node = pipeline.nodes[name]
+        else:
+            node = pipeline.add(
+                name,
+                lambda cell=cell: build_cell(cell, jobserver),
+                deps=deps,
+                outputs=[p for pair in outputs.items() for p in pair],
+                resources={"cargo": 1, "ram": 4},
+                always=True,
+            )
+        for unstripped in outputs:
+            build_nodes[unstripped] = node
+
+# Samples aren't stripped further
+malware = {}
+for _, name in MALWARE:
+    out_path = TARGET_PATH / "malware" / f"{name}.do_not_exec"
+    malware[out_path] = out_path
+categories["malware_samples"] = malware
+
+
+# Fails the node if any sample is missing; the fetched ones still get registered by the manifest
+def fetch_malware():
+    failed = len(build_failures)
+    get_malware_samples(args.malware_source, args.fetch_jobs)
+    if len(build_failures) > failed:
+        raise RuntimeError(
+            "failed to fetch "
+            + ", ".join(description for description, _ in build_failures[failed:])
+        )
+
+
+if any(selected(p) for p in malware):
+    fetch = pipeline.add("fetch:malware", fetch_malware, outputs=list(malware))
+    for unstripped in malware:
+        build_nodes[unstripped] = fetch
+
+
+def write_manifest():
+    write_registry(
+        {
+            category: {k: v for k, v in binaries.items() if Path(k).exists()}
+            for category, binaries in categories.items()
+        },
+        artifact_hashes,
+    )
+
+
+# Registers whatever got built so a single failed cell doesn't hold up the rest of the evaluation
+manifest = pipeline.add(
+    "manifest", write_manifest, after=list(set(build_nodes.values())), always=True
+)
+
+ida_resources = {"ida": 1, "ram": args.ram_per_ida}
+# Besides the binaries the results depend on the tools which produce them so upgrading any of them
+# reruns the affected nodes
+SCRIPTS_PATH = Path(__file__).parent
+ida_key = " ".join(
+    [
+        ida_version(),
+        hash_sources(
+            [
+                IDA_SCRIPT_PATH.parent,
+                IDA_SERVER_PATH,
+                SCRIPTS_PATH / "ida_runner.py",
+                SCRIPTS_PATH / "symbol_dump.py",
+            ]
+        ),
+    ]
+)
+native_key = hash_sources(
+    [SCRIPTS_PATH / p for p in ["native_symbols.py", "names.py", "symbol_dump.py"]]
+)
+sigs_key = f"{rust_sig_gen_version()} {flair_version()}"
+std_nodes = []
+crates_nodes = []
+for category in ["examples", "oss_projects", "malware_samples"]:
+    for unstripped, stripped in categories[category].items():
+        if not selected(unstripped):
+            continue
+        build_node = build_nodes[unstripped]
+        is_msvc = stripped.suffix == ".pdb"
+        source = unstripped if is_msvc else stripped
+        out_path = (EVALUATION_PATH / unstripped.relative_to(TARGET_PATH)).absolute()
+
+        if unstripped != stripped:
+            # Ground truth symbols; for MSVC this will autoload the .pdb
+            out_path_ref = out_path.with_suffix(out_path.suffix + ".reference")
+            if args.native_reference:
+                action = native_reference_action(unstripped, stripped, out_path_ref)
+            else:
+                job = IdaJob(
+                    unstripped,
+                    out_path_ref,
+                    ["nomatch"],
+                    extra_files=[stripped] if is_msvc else [],
+                )
+                action = ida_action(job)
+            ref_inputs = [unstripped] + ([stripped] if is_msvc else [])
+            std_nodes.append(
+                pipeline.add(
+                    f"reference:{unstripped}",
+                    deduped("reference", ref_inputs, out_path_ref, action, args.native_reference),
+                    deps=[build_node],
+                    inputs=ref_inputs,
+                    outputs=[out_path_ref],
+                    key=f"native {native_key}" if args.native_reference else f"ida {ida_key}",
+                    resources={} if args.native_reference else ida_resources,
+                )
+            )
+
+        # Symbols detected using std signatures
+        out_path_matched = out_path.with_suffix(out_path.suffix + ".matched")
+        job = IdaJob(source, out_path_matched, ["match"], ida_args=["-Opdb:off"])
+        std_nodes.append(
+            pipeline.add(
+                f"match:{unstripped}",
+                deduped("match", [source], out_path_matched, ida_action(job)),
+                deps=[build_node],
+                inputs=[source],
+                outputs=[out_path_matched],
+                # The std signatures get generated as part of the job
+                key=f"{ida_key} {sigs_key}",
+                resources=ida_resources,
+            )
+        )
+
+        # Crate signatures and symbols detected using them
+        flags = FLAGS.get(str(unstripped))
+        if category == "examples" or flags in [None, "TODO"]:
+            continue
+        sig_path = (SIGNATURES_PATH / unstripped.relative_to(TARGET_PATH)).absolute()
+        sigs = pipeline.add(
+            f"crate_sigs:{unstripped}",
+            lambda stripped=stripped, flags=flags, sig_path=sig_path: generate_crate_sigs(
+                str(stripped), flags, sig_path
+            ),
+            deps=[build_node],
+            inputs=[stripped],
+            outputs=[sig_path],
+            key=f"{flags} {sigs_key}",
+            resources={"cargo": 1, "ram": 8},
+        )
+        out_path_matched = out_path.with_suffix(out_path.suffix + ".matched_with_crates")
+        job = IdaJob(
+            source, out_path_matched, ["match", str(sig_path)], ida_args=["-Opdb:off"]
+        )
+        crates_nodes.append(
+            pipeline.add(
+                f"match_crates:{unstripped}",
+                deduped("match_crates", [source], out_path_matched, ida_action(job), flags),
+                deps=[sigs],
+                inputs=[source, sig_path],
+                outputs=[out_path_matched],
+                key=f"{ida_key} {sigs_key}",
+                resources=ida_resources,
+            )
+        )
+
+# summary.py has its own per-binary cache so it always runs. It also runs if some binaries failed;
+# those are just left out of the results.
+for mode, nodes in [("std", std_nodes), ("crates", crates_nodes)]:
+    if nodes:
+        command = [sys.executable, "summary.py", mode] + ([args.only] if args.only else [])
+        pipeline.add(
+            f"summary:{mode}",
+            lambda command=command, mode=mode: metrics.check_call(
+                command, "summary", detail=mode
+            ),
+            deps=[manifest],
+            after=nodes,
+            always=True,
+        )
+
+if not args.only:
+    uniqueness_builds = {build_nodes[p] for p in categories["uniqueness"]}
+    pipeline.add(
+        "uniqueness",
+        lambda: subprocess.check_call(
+            [sys.executable, "evaluate_uniqueness.py", "--workers", str(args.workers)]
+        ),
+        deps=[manifest],
+        after=list(uniqueness_builds),
+        inputs=list(categories["uniqueness"].values()),
+        outputs=[TARGET_PATH / "thesis_data" / "uniqueness.json"],
+        # Uses all IDA instances itself
+        resources={"ida": args.workers},
+    )
+
+failed = pipeline.run(state, workers=2 * args.workers + args.cells + 4)
+if args.backend == "idalib":
+    runner.shutdown()
+if failed:
+    print(f"{len(failed)} node(s) failed or were skipped:")
+    for name in sorted(failed):
+        print(f"  {name}")
+    sys.exit(1)
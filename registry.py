@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import argparse
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+from artifact_store import hash_artifacts
+from shared import TARGET_PATH
+
+# Registry of all binaries built by build.py/pipeline.py (replaces the old binaries.json). Every
+# (category, unstripped bin) pair is a row with its stripped bin (or .pdb for MSVC), the matrix
+# cell it was built in and the content hashes from the artifact store. The cell columns are
+# indexed so e.g. all release MSVC binaries of 1.82.0 can be selected without a scan:
+#
+#   uv run registry.py --version 1.82.0 --profile release --target-env msvc
+
+REGISTRY_PATH = TARGET_PATH / "binaries.sqlite"
+
+SCHEMA = """
+CREATE TABLE binaries (
+    category TEXT NOT NULL,
+    unstripped TEXT NOT NULL,
+    stripped TEXT NOT NULL,
+    version TEXT,
+    target TEXT,
+    target_env TEXT,
+    profile TEXT,
+    name TEXT NOT NULL,
+    hash TEXT,
+    stripped_hash TEXT,
+    PRIMARY KEY (category, unstripped)
+);
+CREATE INDEX binaries_cell ON binaries (version, target, profile);
+CREATE INDEX binaries_env ON binaries (target_env, version, profile);
+CREATE INDEX binaries_name ON binaries (name);
+CREATE INDEX binaries_hash ON binaries (hash);
+"""
+
+# Columns which can be filtered on; the values are matched exactly
+FILTER_COLUMNS = ["version", "target", "target_env", "profile", "name", "hash"]
+
+
+# Matrix cell of an artifact from its path (target/<version>/<target>/<profile>/<name>); other
+# artifacts (e.g. malware samples) only have a name
+def artifact_cell(unstripped):
+    parts = Path(unstripped).relative_to(TARGET_PATH).parts
+    if len(parts) == 4:
+        version, target, profile, name = parts
+        return version, target, target.rsplit("-", 1)[-1], profile, name
+    return None, None, None, None, parts[-1]
+
+
+# Map: category -> {unstripped bin -> stripped bin}; `known_hashes` saves rehashing artifacts
+# whose hash is already known (see `artifact_hashes` in build.py)
+def write_registry(categories, known_hashes):
+    paths = {str(p) for binaries in categories.values() for pair in binaries.items() for p in pair}
+    hashes = hash_artifacts(paths, known_hashes)
+
+    rows = []
+    for category, binaries in categories.items():
+        for unstripped, stripped in binaries.items():
+            unstripped, stripped = str(unstripped), str(stripped)
+            rows.append(
+                (category, unstripped, stripped)
+                + artifact_cell(unstripped)
+                + (hashes.get(unstripped), hashes.get(stripped))
+            )
+
+    # Replace the registry atomically so concurrently running readers never see a partial one
+    tmp_path = REGISTRY_PATH.with_name(f".{REGISTRY_PATH.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    with closing(sqlite3.connect(tmp_path)) as db:
+        db.executescript(SCHEMA)
+        db.executemany(f"INSERT INTO binaries VALUES ({', '.join('?' * 10)})", rows)
+        db.commit()
+    tmp_path.replace(REGISTRY_PATH)
+
+
+def connect():
+    if not REGISTRY_PATH.exists():
+        raise FileNotFoundError(f"{REGISTRY_PATH} doesn't exist; run build.py first")
+    db = sqlite3.connect(f"file:{REGISTRY_PATH}?mode=ro", uri=True)
+    db.row_factory = sqlite3.Row
+    db.create_function(
+        "regexp", 2, lambda pattern, s: re.search(pattern, s) is not None, deterministic=True
+    )
+    return db
+
+
+# Rows matching all given filters in the order they were registered. `categories`/`exclude` are
+# lists of categories and `regex` is searched for in the unstripped path.
+def query(categories=None, exclude=None, regex=None, **filters):
+    conditions = []
+    params = []
+    if categories is not None:
+        conditions.append(f"category IN ({', '.join('?' * len(categories))})")
+        params += categories
+    if exclude:
+        conditions.append(f"category NOT IN ({', '.join('?' * len(exclude))})")
+        params += exclude
+    for column, value in filters.items():
+        assert column in FILTER_COLUMNS, f"unknown column {column}"
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if regex:
+        conditions.append("unstripped REGEXP ?")
+        params.append(regex)
+
+    sql = "SELECT * FROM binaries"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    with closing(connect()) as db:
+        return db.execute(sql + " ORDER BY rowid", params).fetchall()
+
+
+# Map: unstripped bin -> stripped bin (binaries in several categories are only listed once)
+def select(categories=None, exclude=None, regex=None, **filters):
+    return {
+        row["unstripped"]: row["stripped"]
+        for row in query(categories, exclude, regex, **filters)
+    }
+
+
+# Map: artifact path -> sha256 (for deduplication; see artifact_store.py)
+def artifact_hashes():
+    hashes = {}
+    with closing(connect()) as db:
+        for unstripped, stripped, hash, stripped_hash in db.execute(
+            "SELECT unstripped, stripped, hash, stripped_hash FROM binaries"
+        ):
+            if hash:
+                hashes[unstripped] = hash
+            if stripped_hash:
+                hashes[stripped] = stripped_hash
+    return hashes
+
+
+def add_registry_arguments(parser):
+    parser.add_argument("--version", help="only consider binaries built with this toolchain")
+    parser.add_argument("--target", help="only consider binaries built for this target")
+    parser.add_argument(
+        "--target-env", help="only consider binaries with this target environment (e.g. msvc)"
+    )
+    parser.add_argument("--profile", choices=["debug", "release"])
+    parser.add_argument("--name", help="only consider binaries with this file name")
+
+
+def registry_filters(args):
+    return {column: getattr(args, column, None) for column in FILTER_COLUMNS}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--category", action="append", help="only list binaries of this category"
+    )
+    parser.add_argument("regex", nargs="?", help="optional regex to filter the unstripped paths")
+    add_registry_arguments(parser)
+    parser.add_argument("--hash", help="only list binaries with this content hash")
+    parser.add_argument(
+        "-l", "--long", action="store_true", help="also list the category, cell and hash"
+    )
+    args = parser.parse_args()
+
+    for row in query(args.category, None, args.regex, **registry_filters(args)):
+        if args.long:
+            print("\t".join(str(row[k]) for k in row.keys()))
+        else:
+            print(f"{row['unstripped']}\t{row['stripped']}")
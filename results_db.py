@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import argparse
+import re
+import sqlite3
+from contextlib import closing
+
+from registry import add_registry_arguments, artifact_cell, registry_filters
+from shared import TARGET_PATH
+
+# Per-symbol classifications written by summary.py so questions like "which std functions are a
+# sig_collision on every i686 target" don't need re-parsing all the dumps:
+#
+#   uv run results_db.py std --category sig_collision --every --symbol '^std::' i686
+#
+# Every summarized binary is a row in `binaries` (with the key of `summary_key()` so only changed
+# binaries get replaced) and each of its reference functions is a row in `symbols`.
+
+RESULTS_DB_PATH = TARGET_PATH / "results.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS binaries (
+    id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    binary TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version TEXT,
+    target TEXT,
+    target_env TEXT,
+    profile TEXT,
+    name TEXT NOT NULL,
+    UNIQUE (mode, binary)
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    binary_id INTEGER NOT NULL REFERENCES binaries (id),
+    address INTEGER NOT NULL,
+    size INTEGER,
+    real_name TEXT NOT NULL,
+    matched_name TEXT NOT NULL,
+    real_demangled TEXT NOT NULL,
+    matched_demangled TEXT NOT NULL,
+    category TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_binary ON symbols (binary_id);
+CREATE INDEX IF NOT EXISTS symbols_category ON symbols (category, real_demangled);
+CREATE INDEX IF NOT EXISTS symbols_real ON symbols (real_demangled);
+"""
+
+SYMBOL_COLUMNS = [
+    "address",
+    "size",
+    "real_name",
+    "matched_name",
+    "real_demangled",
+    "matched_demangled",
+    "category",
+]
+
+
+def open_results():
+    TARGET_PATH.mkdir(exist_ok=True)
+    db = sqlite3.connect(RESULTS_DB_PATH)
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.executescript(SCHEMA)
+    db.create_function(
+        "regexp", 2, lambda pattern, s: re.search(pattern, s) is not None, deterministic=True
+    )
+    return db
+
+
+# Map: binary -> key of its stored results
+def stored_keys(db, mode):
+    return dict(db.execute("SELECT binary, key FROM binaries WHERE mode = ?", [mode]))
+
+
+# Replaces the stored symbols of a binary; `symbols` are tuples in the order of `SYMBOL_COLUMNS`
+def store_symbols(db, mode, binary, key, symbols):
+    with db:
+        db.execute(
+            "DELETE FROM symbols WHERE binary_id IN "
+            "(SELECT id FROM binaries WHERE mode = ? AND binary = ?)",
+            [mode, binary],
+        )
+        db.execute("DELETE FROM binaries WHERE mode = ? AND binary = ?", [mode, binary])
+        binary_id = db.execute(
+            "INSERT INTO binaries (mode, binary, key, version, target, target_env, profile, name) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [mode, binary, key, *artifact_cell(binary)],
+        ).lastrowid
+        db.executemany(
+            f"INSERT INTO symbols VALUES (?, {', '.join('?' * len(SYMBOL_COLUMNS))})",
+            ((binary_id, *symbol) for symbol in symbols),
+        )
+
+
+# Binary filter shared by all queries; `regex` is searched for in the binary's path
+def binary_conditions(mode, regex=None, **filters):
+    conditions = ["b.mode = ?"]
+    params = [mode]
+    for column, value in filters.items():
+        if value is not None:
+            conditions.append(f"b.{column} = ?")
+            params.append(value)
+    if regex:
+        conditions.append("b.binary REGEXP ?")
+        params.append(regex)
+    return " AND ".join(conditions), params
+
+
+# Symbols of the selected binaries, optionally restricted to a category and demangled real names
+# matching `symbol`
+def query_symbols(db, mode, category=None, symbol=None, regex=None, **filters):
+    where, params = binary_conditions(mode, regex, **filters)
+    if category:
+        where += " AND s.category = ?"
+        params.append(category)
+    if symbol:
+        where += " AND s.real_demangled REGEXP ?"
+        params.append(symbol)
+    columns = ", ".join(f"s.{c}" for c in SYMBOL_COLUMNS)
+    return db.execute(
+        f"SELECT b.binary, {columns} FROM symbols s JOIN binaries b ON s.binary_id = b.id "
+        f"WHERE {where} ORDER BY b.id, s.address",
+        params,
+    )
+
+
+# Demangled real names which are in `category` in every one of the selected binaries. Returns
+# (name, number of binaries)
+def query_every(db, mode, category, symbol=None, regex=None, **filters):
+    where, params = binary_conditions(mode, regex, **filters)
+    # Binaries without reference symbols don't have any classifications
+    (binaries,) = db.execute(
+        f"SELECT COUNT(*) FROM binaries b WHERE {where} "
+        "AND EXISTS (SELECT 1 FROM symbols s WHERE s.binary_id = b.id)",
+        params,
+    ).fetchone()
+    symbol_where = " AND s.real_demangled REGEXP ?" if symbol else ""
+    return db.execute(
+        f"SELECT s.real_demangled, COUNT(DISTINCT s.binary_id) FROM symbols s "
+        f"JOIN binaries b ON s.binary_id = b.id WHERE {where}{symbol_where} "
+        "GROUP BY s.real_demangled "
+        "HAVING SUM(s.category != ?) = 0 AND COUNT(DISTINCT s.binary_id) = ? "
+        "ORDER BY s.real_demangled",
+        params + ([symbol] if symbol else []) + [category, binaries],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "mode", choices=["std", "crates"], help="mode, either std or crates"
+    )
+    parser.add_argument(
+        "filter", nargs="?", help="optional regex to filter which binaries to consider"
+    )
+    parser.add_argument("--category", help="only list symbols with this classification")
+    parser.add_argument("--symbol", help="regex the demangled real name has to match")
+    parser.add_argument(
+        "--every",
+        action="store_true",
+        help="only list symbols which have --category in every selected binary",
+    )
+    add_registry_arguments(parser)
+    args = parser.parse_args()
+    if args.every and not args.category:
+        parser.error("--every requires --category")
+
+    filters = {k: v for k, v in registry_filters(args).items() if k != "hash"}
+    with closing(open_results()) as db:
+        if args.every:
+            for name, binaries in query_every(
+                db, args.mode, args.category, args.symbol, args.filter, **filters
+            ):
+                print(f"{name}\t{binaries}")
+        else:
+            for binary, address, *columns in query_symbols(
+                db, args.mode, args.category, args.symbol, args.filter, **filters
+            ):
+                print("\t".join([binary, hex(address)] + [str(c) for c in columns]))
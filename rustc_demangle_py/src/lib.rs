@@ -1,4 +1,5 @@
 use pyo3::prelude::*;
+use rayon::prelude::*;
 
 #[pyfunction]
 fn demangle(s: &str) -> String {
@@ -17,10 +18,23 @@ fn demangle_msvc(s: &str) -> String {
     msvc_demangler::demangle(s, flags).unwrap_or(s.to_owned())
 }
 
+/// Demangles all symbols at once and returns `(demangle, demangle_no_hash, demangle_msvc)` for each
+/// of them. The work is spread across threads with the GIL released.
+#[pyfunction]
+fn demangle_batch(py: Python<'_>, symbols: Vec<String>) -> Vec<(String, String, String)> {
+    py.allow_threads(|| {
+        symbols
+            .par_iter()
+            .map(|s| (demangle(s), demangle_no_hash(s), demangle_msvc(s)))
+            .collect()
+    })
+}
+
 #[pymodule]
 fn rustc_demangle_py(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(demangle, m)?)?;
     m.add_function(wrap_pyfunction!(demangle_no_hash, m)?)?;
     m.add_function(wrap_pyfunction!(demangle_msvc, m)?)?;
+    m.add_function(wrap_pyfunction!(demangle_batch, m)?)?;
     Ok(())
 }
@@ -1,3 +1,8 @@
+import functools
+import hashlib
+import json
+import shutil
+import subprocess
 from pathlib import Path
 
 TARGET_PATH = Path("target")
@@ -5,3 +10,51 @@ THESIS_DATA_PATH = Path(TARGET_PATH / "thesis_data")
 
 # TODO: meh...
 FLAIR_PATH = Path("~/master_thesis/ida/flair90/").expanduser()
+
+
+@functools.cache
+def rust_sig_gen_version():
+    return subprocess.check_output(["rust-sig-gen", "--version"]).decode().strip()
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+@functools.cache
+def flair_version():
+    # FLAIR doesn't report a version so identify it by its `sigmake` binary instead
+    sigmake = FLAIR_PATH / "bin" / "linux" / "sigmake"
+    return hash_file(sigmake) if sigmake.exists() else str(FLAIR_PATH)
+
+
+@functools.cache
+def ida_version():
+    # Identify the IDA installation (`ida` on the PATH or the one `idalib` links into) by its kernel
+    ida = shutil.which("ida")
+    if ida:
+        ida_dir = Path(ida).resolve().parent
+    else:
+        ida_dir = (Path(__file__).parent / "idalib").resolve().parent.parent
+    for name in ["libida.so", "libida64.so"]:
+        if (ida_dir / name).exists():
+            return hash_file(ida_dir / name)
+    return str(ida_dir)
+
+
+# Content of all Python files of the given files/directories (e.g. our IDA scripts)
+def hash_sources(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        files = sorted(path.rglob("*.py")) if path.is_dir() else [path]
+        for file in files:
+            h.update(f"{file} {hash_file(file)}".encode())
+    return h.hexdigest()
+
+
+# Everything which influences the signatures generated for a binary; `extra` is anything else the
+# caller passes to `rust-sig-gen` (e.g. the flags for crate signatures)
+def sig_stamp(binary, *extra):
+    key = [hash_file(binary), *extra, rust_sig_gen_version(), flair_version()]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+from bisect import bisect_left
+from pathlib import Path
+
+from shared import TARGET_PATH
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compact on-disk format for the `.reference` / `.matched*` symbol dumps. The original format is a
+# single JSON line mapping stringified addresses to names (plus a trailing line with the number of
+# library functions) which is slow to parse for large debug builds. Instead we store:
+#
+#   header     magic, version, number of functions, number of library functions (-1 if unknown)
+#   records    one per function sorted by address: address (u64), size (u32), flags (u32) and the
+#              end offset of its name in the string table (u64)
+#   strings    UTF-8 encoded names
+#
+# Records can be written one at a time as the functions get enumerated (see `DumpWriter`) and the
+# file can be memory-mapped and joined by address without materializing any dicts. Optionally the
+# whole file is zstd-compressed (needs the `zstd` extra, i.e. `uv run --extra zstd ...`) in which
+# case it gets decompressed into memory instead. Readers transparently fall back to version 1
+# (separate address and offset arrays; no sizes/flags) and the old JSON format.
+
+MAGIC = b"RSYM"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sIQq")
+RECORD = struct.Struct("<QIIQ")
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Function flags
+FLAG_LIB = 1
+FLAG_THUNK = 2
+# Taken from the symbol table instead of IDA's analysis (see native_symbols.py); set on every
+# function of a native reference dump
+FLAG_NATIVE = 4
+
+# Names are buffered in memory up to this size before spilling to disk
+STRINGS_SPOOL_SIZE = 16 * 2**20
+
+
+class SymbolDump:
+    def __init__(self, buf):
+        magic, version, n, lib_funcs = HEADER.unpack_from(buf)
+        if magic != MAGIC or version not in [1, 2]:
+            raise ValueError("not a symbol dump")
+        self.lib_funcs = lib_funcs if lib_funcs >= 0 else None
+
+        view = memoryview(buf)
+        start = HEADER.size
+        if version == 1:
+            self.addresses = view[start : start + 8 * n].cast("Q")
+            start += 8 * n
+            # The first offset is always 0
+            self.ends = view[start + 8 : start + 8 * (n + 1)].cast("Q")
+            start += 8 * (n + 1)
+            self.sizes = None
+            self.flags = None
+        else:
+            records = view[start : start + RECORD.size * n]
+            self.addresses = records.cast("Q")[0::3]
+            self.ends = records.cast("Q")[2::3]
+            self.sizes = records.cast("I")[2::6]
+            self.flags = records.cast("I")[3::6]
+            start += RECORD.size * n
+        self.strings = view[start:]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def name(self, i):
+        start = self.ends[i - 1] if i else 0
+        return str(self.strings[start : self.ends[i]], "utf-8")
+
+    def names(self):
+        return (self.name(i) for i in range(len(self)))
+
+    def items(self):
+        return zip(self.addresses, self.names())
+
+    # Size and flags are only known for dumps exported by the current IDA scripts
+    def size(self, i):
+        return self.sizes[i] if self.sizes is not None else None
+
+    def is_lib(self, i):
+        return self.flags is not None and self.flags[i] & FLAG_LIB != 0
+
+    def is_thunk(self, i):
+        return self.flags is not None and self.flags[i] & FLAG_THUNK != 0
+
+    # Native reference dumps lack the functions IDA discovers without a symbol (`sub_...`) so their
+    # totals aren't comparable with IDA generated ones
+    def is_native(self):
+        return len(self) > 0 and self.flags is not None and self.flags[0] & FLAG_NATIVE != 0
+
+    def get(self, addr):
+        i = bisect_left(self.addresses, addr)
+        if i < len(self) and self.addresses[i] == addr:
+            return self.name(i)
+        return None
+
+    # Sorted-merge join on the address; yields `(own index, other index)` for every address present
+    # in both dumps
+    def join_indices(self, other):
+        i, j = 0, 0
+        a, b = self.addresses, other.addresses
+        while i < len(a) and j < len(b):
+            if a[i] < b[j]:
+                i += 1
+            elif a[i] > b[j]:
+                j += 1
+            else:
+                yield i, j
+                i += 1
+                j += 1
+
+    # Same as `join_indices()` but yields `(addr, own name, other name)`
+    def join(self, other):
+        for i, j in self.join_indices(other):
+            yield self.addresses[i], self.name(i), other.name(j)
+
+
+# Streams records to disk as they're added; they have to be added in ascending address order
+class DumpWriter:
+    def __init__(self, path, compress=False):
+        if compress and zstandard is None:
+            raise RuntimeError("zstd compression needs the `zstd` extra (`uv run --extra zstd`)")
+        self.path = Path(path)
+        self.compress = compress
+        # Write to a temporary file first so readers never see a partial dump
+        self.tmp_path = Path(f"{path}.tmp")
+        self.f = open(self.tmp_path, "wb")
+        # Placeholder until we know the number of records
+        self.f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, -1))
+        self.strings = tempfile.SpooledTemporaryFile(max_size=STRINGS_SPOOL_SIZE)
+        self.n = 0
+        self.end = 0
+        self.last_addr = -1
+
+    def add(self, addr, name, size=0, flags=0):
+        if addr <= self.last_addr:
+            raise ValueError(f"{addr:#x} is out of order")
+        self.last_addr = addr
+        name = name.encode()
+        self.end += len(name)
+        self.f.write(RECORD.pack(addr, size, flags, self.end))
+        self.strings.write(name)
+        self.n += 1
+
+    def close(self, lib_funcs=None):
+        self.strings.seek(0)
+        shutil.copyfileobj(self.strings, self.f)
+        self.strings.close()
+        self.f.seek(0)
+        self.f.write(
+            HEADER.pack(MAGIC, FORMAT_VERSION, self.n, -1 if lib_funcs is None else lib_funcs)
+        )
+        self.f.close()
+        if self.compress:
+            data = zstandard.ZstdCompressor().compress(self.tmp_path.read_bytes())
+            self.tmp_path.write_bytes(data)
+        self.tmp_path.replace(self.path)
+
+    def discard(self):
+        self.strings.close()
+        self.f.close()
+        self.tmp_path.unlink()
+
+
+def encode_dump(names, lib_funcs=None):
+    items = sorted((int(addr), name) for addr, name in names.items())
+    strings = bytearray()
+    records = bytearray()
+    for addr, name in items:
+        strings += name.encode()
+        records += RECORD.pack(addr, 0, 0, len(strings))
+    return b"".join(
+        [
+            HEADER.pack(MAGIC, FORMAT_VERSION, len(items), -1 if lib_funcs is None else lib_funcs),
+            records,
+            strings,
+        ]
+    )
+
+
+def write_dump(path, names, lib_funcs=None, compress=False):
+    writer = DumpWriter(path, compress)
+    for addr, name in sorted((int(addr), name) for addr, name in names.items()):
+        writer.add(addr, name)
+    writer.close(lib_funcs)
+
+
+def read_json_dump(path):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    names = json.loads(lines[0])
+    lib_funcs = int(lines[1]) if len(lines) > 1 else None
+    return names, lib_funcs
+
+
+# Opens a dump in any of the supported formats
+def open_dump(path):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic == MAGIC:
+            return SymbolDump(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if magic == ZSTD_MAGIC:
+            if zstandard is None:
+                raise RuntimeError(
+                    f"{path} is zstd-compressed; run with the `zstd` extra (`uv run --extra zstd`)"
+                )
+            f.seek(0)
+            return SymbolDump(zstandard.ZstdDecompressor().decompress(f.read()))
+    names, lib_funcs = read_json_dump(path)
+    return SymbolDump(encode_dump(names, lib_funcs))
+
+
+# Whether the dump is in the current format and compressed iff `compress` (compressed dumps are
+# always written in the current format)
+def is_current_dump(path, compress=False):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if header[:4] == ZSTD_MAGIC:
+        return compress
+    return (
+        not compress
+        and len(header) == HEADER.size
+        and HEADER.unpack(header)[:2] == (MAGIC, FORMAT_VERSION)
+    )
+
+
+# Converts existing JSON (and version 1) dumps in place and (de)compresses them as requested
+def convert(paths, compress):
+    for path in paths:
+        if is_current_dump(path, compress):
+            continue
+        print(path)
+        dump = open_dump(path)
+        # Keep the sizes and flags of dumps which already have them
+        writer = DumpWriter(path, compress)
+        for i, addr in enumerate(dump.addresses):
+            flags = dump.flags[i] if dump.flags is not None else 0
+            writer.add(addr, dump.name(i), dump.size(i) or 0, flags)
+        writer.close(dump.lib_funcs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        type=Path,
+        help="dumps to convert (default: all dumps in target/evaluation)",
+    )
+    parser.add_argument(
+        "--zstd",
+        action="store_true",
+        help="zstd-compress the dumps (otherwise compressed ones get decompressed)",
+    )
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        paths = [
+            p
+            for p in (TARGET_PATH / "evaluation").rglob("*")
+            if p.is_file() and (p.suffix == ".reference" or p.suffix.startswith(".matched"))
+        ]
+    convert(paths, args.zstd)
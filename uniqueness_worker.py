@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from pathlib import Path
+
+import idapro
+import ida_auto
+import ida_funcs
+import ida_segment
+import ida_undo
+import idautils
+
+from ida_snapshot import open_snapshot, save_snapshot
+
+# Computes a single row of the uniqueness matrix; spawned by evaluate_uniqueness.py
+# Usage: uniqueness_worker.py <binary> <out.json> <undo|snapshot> <sig>...
+#
+# There are two strategies to get the per-signature match counts out of a single auto-analysis:
+# - undo: Create an undo point before applying each signature and undo it afterwards.
+# - snapshot: Save the analyzed database once and reopen that snapshot for every signature (see
+#   ida_snapshot.py). IDA doesn't expose a read-only FLIRT match query.
+
+
+# Adapted from idalib's idacli.py example
+def apply_sig_file(sig_file_name):
+    ida_funcs.plan_to_apply_idasgn(sig_file_name)
+    ida_auto.auto_wait()
+
+    match_count = 0
+    for index in range(0, ida_funcs.get_idasgn_qty()):
+        fname, _, fmatches = ida_funcs.get_idasgn_desc_with_matches(index)
+        if fname in sig_file_name:
+            match_count = fmatches
+            break
+
+    return match_count
+
+
+def count_functions():
+    total = 0
+    for ea in idautils.Functions():
+        # Ignore imports; only works properly for Linux which suffices here
+        if ida_segment.get_segm_name(ida_segment.getseg(ea)) == "extern":
+            continue
+        total += 1
+    return total
+
+
+def row_with_undo(sigs):
+    row = []
+    for sig in sigs:
+        assert ida_undo.create_undo_point(b"pre_sig")
+        row.append(apply_sig_file(sig))
+        assert ida_undo.perform_undo()
+
+    # Close database without saving
+    idapro.close_database(False)
+    return row
+
+
+def row_with_snapshot(binary, sigs):
+    snapshot = Path(binary).with_suffix(".snapshot.i64")
+    save_snapshot(snapshot)
+
+    row = []
+    for sig in sigs:
+        with open_snapshot(snapshot):
+            row.append(apply_sig_file(sig))
+    return row
+
+
+binary, out_path, mode, sigs = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:]
+
+# Open database and wait for auto-analysis
+idapro.open_database(binary, True)
+
+# Get total number of functions
+total = count_functions()
+
+if mode == "snapshot":
+    row = row_with_snapshot(binary, sigs)
+else:
+    row = row_with_undo(sigs)
+
+with open(out_path, "w") as f:
+    f.write(json.dumps({"total_functions": total, "row": row}))